@@ -0,0 +1,240 @@
+from datetime import date as date_type, timedelta
+
+ACHIEVEMENTS = {
+    "first_meal": {"name": "First Bite", "description": "Log your first meal", "emoji": "🍽️"},
+    "five_meals": {"name": "Meal Logger", "description": "Log 5 meals", "emoji": "📝"},
+    "first_workout": {"name": "Fitness Start", "description": "Log your first workout", "emoji": "💪"},
+    "first_water": {"name": "Hydration Hero", "description": "Log your first water intake", "emoji": "💧"},
+    "water_goal": {"name": "Aqua Master", "description": "Drink 2L+ water in one day", "emoji": "🌊"},
+    "on_target": {"name": "Perfect Day", "description": "Stay within calorie goal", "emoji": "🎯"},
+    "week_on_track": {"name": "Consistency", "description": "7 days on target", "emoji": "📅"},
+    "macro_master": {"name": "Macro Master", "description": "Hit macros within 10%", "emoji": "🎪"},
+    "high_protein": {"name": "Protein Powerhouse", "description": "100g+ protein in one day", "emoji": "🥚"},
+    "workout_warrior": {"name": "Workout Warrior", "description": "Complete 5 workouts", "emoji": "🔥"},
+}
+
+# Bump whenever a rule is added or changed so stored progress is replayed from history
+RULES_VERSION = 1
+
+EVENT_KINDS = ("meal", "workout", "water", "weight")
+
+
+def _previous_day(date):
+    return (date_type.fromisoformat(date) - timedelta(days=1)).isoformat()
+
+
+class CountRule:
+    # Earned once `threshold` events of one kind have been logged
+
+    def __init__(self, achievement_id, kind, threshold):
+        self.achievement_id = achievement_id
+        self.kinds = (kind,)
+        self.threshold = threshold
+
+    def initial_state(self):
+        return {"count": 0}
+
+    def on_event(self, state, kind, date, payload, user_data):
+        state["count"] += 1
+        return state["count"] >= self.threshold
+
+    def on_rollover(self, state, today, user_data):
+        return False
+
+
+class DailyTotalRule:
+    # Earned when one field summed over a single day reaches `threshold`
+
+    def __init__(self, achievement_id, kind, field, threshold):
+        self.achievement_id = achievement_id
+        self.kinds = (kind,)
+        self.field = field
+        self.threshold = threshold
+
+    def initial_state(self):
+        return {"date": None, "total": 0}
+
+    def on_event(self, state, kind, date, payload, user_data):
+        if state["date"] != date:
+            state["date"] = date
+            state["total"] = 0
+        state["total"] += payload[self.field]
+        return state["total"] >= self.threshold
+
+    def on_rollover(self, state, today, user_data):
+        return False
+
+
+class ClosedDayRule:
+    # Accumulates the open day's intake and judges it once a later day starts,
+    # so a day is never counted as on target before it is over
+
+    kinds = ("meal", "workout")
+
+    def __init__(self, achievement_id):
+        self.achievement_id = achievement_id
+
+    def day_state(self):
+        return {"date": None, "calories": 0, "burned": 0, "protein": 0, "carbs": 0, "fat": 0, "meals": 0}
+
+    def initial_state(self):
+        return self.day_state()
+
+    def on_event(self, state, kind, date, payload, user_data):
+        earned = False
+        if state["date"] != date:
+            earned = self._close(state, user_data)
+            state.update(self.day_state(), date=date)
+        if kind == "meal":
+            for field in ("calories", "protein", "carbs", "fat"):
+                state[field] += payload[field]
+            state["meals"] += 1
+        else:
+            state["burned"] += payload["calories_burned"]
+        return earned
+
+    def on_rollover(self, state, today, user_data):
+        if state["date"] is None or state["date"] >= today:
+            return False
+        earned = self._close(state, user_data)
+        state.update(self.day_state())
+        return earned
+
+    def _close(self, state, user_data):
+        if state["date"] is None:
+            return False
+        on_target = state["meals"] > 0 and state["calories"] - state["burned"] <= user_data["daily_calorie_goal"]
+        return self.judge_day(state, on_target, user_data)
+
+    def judge_day(self, state, on_target, user_data):
+        return on_target
+
+
+class OnTargetRule(ClosedDayRule):
+    pass
+
+
+class WeekOnTrackRule(ClosedDayRule):
+    # Keeps only the length and last day of the current run of on-target days
+
+    def __init__(self, achievement_id, days):
+        super().__init__(achievement_id)
+        self.days = days
+
+    def initial_state(self):
+        return dict(self.day_state(), run=0, run_end=None)
+
+    def judge_day(self, state, on_target, user_data):
+        if not on_target:
+            state["run"], state["run_end"] = 0, None
+            return False
+        if state["run_end"] is not None and state["run_end"] == _previous_day(state["date"]):
+            state["run"] += 1
+        else:
+            state["run"] = 1
+        state["run_end"] = state["date"]
+        return state["run"] >= self.days
+
+
+class MacroMasterRule(ClosedDayRule):
+    # Protein, carbs and fat all within `tolerance` of their goals on a finished day
+
+    def __init__(self, achievement_id, tolerance):
+        super().__init__(achievement_id)
+        self.tolerance = tolerance
+
+    def judge_day(self, state, on_target, user_data):
+        if state["meals"] == 0:
+            return False
+        for field in ("protein", "carbs", "fat"):
+            goal = user_data[f"daily_{field}_goal"]
+            if abs(state[field] - goal) > goal * self.tolerance:
+                return False
+        return True
+
+
+RULES = [
+    CountRule("first_meal", "meal", 1),
+    CountRule("five_meals", "meal", 5),
+    CountRule("first_workout", "workout", 1),
+    CountRule("first_water", "water", 1),
+    CountRule("workout_warrior", "workout", 5),
+    DailyTotalRule("water_goal", "water", "amount_ml", 2000),
+    DailyTotalRule("high_protein", "meal", "protein", 100),
+    OnTargetRule("on_target"),
+    WeekOnTrackRule("week_on_track", 7),
+    MacroMasterRule("macro_master", 0.1),
+]
+
+RULES_BY_KIND = {kind: [rule for rule in RULES if kind in rule.kinds] for kind in EVENT_KINDS}
+
+
+def initial_state():
+    # Rule state for a document with no history yet
+    state = {rule.achievement_id: rule.initial_state() for rule in RULES}
+    state["version"] = RULES_VERSION
+    return state
+
+
+def _award(user_data, achievement_id, earned):
+    if achievement_id not in user_data["achievements"]:
+        user_data["achievements"].append(achievement_id)
+        earned.append(achievement_id)
+
+
+def on_event(user_data, kind, date, payload):
+    # Feed one log event to the rules subscribed to its kind; returns newly earned ids
+    state = user_data["achievement_state"]
+    owned = set(user_data["achievements"])
+    earned = []
+    for rule in RULES_BY_KIND[kind]:
+        if rule.achievement_id in owned:
+            continue
+        if rule.on_event(state[rule.achievement_id], kind, date, payload, user_data):
+            _award(user_data, rule.achievement_id, earned)
+    return earned
+
+
+def on_rollover(user_data, today):
+    # Close out the previous day for rules that judge finished days
+    state = user_data["achievement_state"]
+    owned = set(user_data["achievements"])
+    earned = []
+    for rule in RULES:
+        if rule.achievement_id in owned:
+            continue
+        if rule.on_rollover(state[rule.achievement_id], today, user_data):
+            _award(user_data, rule.achievement_id, earned)
+    return earned
+
+
+def replay(user_data, today=None):
+    # Bulk re-evaluation: reset every rule and feed the whole history once, in date order
+    user_data["achievement_state"] = initial_state()
+    user_data["achievements"] = []
+    sections = (("meal", "meals"), ("workout", "workouts"), ("water", "water_intake"))
+    dates = set(user_data["weight_log"])
+    for _, section in sections:
+        dates.update(user_data[section])
+    for date in sorted(dates):
+        for kind, section in sections:
+            for entry in user_data[section].get(date, []):
+                on_event(user_data, kind, date, entry)
+        if date in user_data["weight_log"]:
+            on_event(user_data, "weight", date, {"weight": user_data["weight_log"][date]})
+    if today is not None:
+        on_rollover(user_data, today)
+    return list(user_data["achievements"])
+
+
+def needs_replay(user_data):
+    # Documents without engine state or with state from older rules
+    state = user_data.get("achievement_state")
+    return not state or state.get("version") != RULES_VERSION
+
+
+def ensure_achievements(user_data, today=None):
+    if needs_replay(user_data):
+        replay(user_data, today)
+        return True
+    return False
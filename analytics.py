@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+from entries import TOTAL_FIELDS
+
+# Columns of user_data["daily_totals"] records
+TOTAL_COLUMNS = list(TOTAL_FIELDS)
+COUNT_COLUMNS = ["meal_count", "workout_count", "water_count"]
+
+ANALYTICS_RANGES = {
+    "Last 7 Days": 7,
+    "Last 30 Days": 30,
+    "Last 90 Days": 90,
+    "Last 365 Days": 365,
+    "All Time": None,
+}
+
+RESAMPLE_RULES = {
+    "Daily": None,
+    # Monday to Sunday, labelled by the Monday (see resample_frame)
+    "Weekly": "W-MON",
+    "Monthly": "MS",
+}
+
+DATE_LABELS = {
+    None: "%a, %b %d",
+    "W-MON": "Week of %b %d",
+    "MS": "%b %Y",
+}
+
+ROLLING_WINDOW = 7
+
+
+def build_daily_frame(daily_totals):
+    # One row per calendar day from the first logged day to the last, gaps filled with zeros
+    if not daily_totals:
+        frame = pd.DataFrame(columns=TOTAL_COLUMNS, index=pd.DatetimeIndex([], name="date"), dtype="float64")
+    else:
+        frame = pd.DataFrame.from_dict(daily_totals, orient="index", columns=TOTAL_COLUMNS).fillna(0)
+        frame.index = pd.to_datetime(frame.index, format="%Y-%m-%d")
+        frame = frame.sort_index()
+        frame = frame.reindex(pd.date_range(frame.index[0], frame.index[-1], freq="D"), fill_value=0)
+        frame.index.name = "date"
+    frame["net"] = frame["calories"] - frame["burned"]
+    return frame
+
+
+def range_start(days, end):
+    # First date ("YYYY-MM-DD") of the last `days` days up to `end`; None for all history
+    if days is None:
+        return None
+    return (pd.Timestamp(end) - pd.Timedelta(days=days - 1)).strftime("%Y-%m-%d")
+
+
+def select_range(frame, days, end):
+    # Last `days` days up to `end` (all history when days is None), zero-filled where nothing
+    # was logged. The rolling average is taken after filling, over logged days before the range too.
+    end = pd.Timestamp(end)
+    if days is None:
+        start = frame.index[0] if len(frame) else end
+    else:
+        start = end - pd.Timedelta(days=days - 1)
+    start = min(start, end)
+    first = start - pd.Timedelta(days=ROLLING_WINDOW - 1)
+    if len(frame):
+        first = min(max(first, frame.index[0]), start)
+    index = pd.date_range(first, end, freq="D", name="date")
+    frame = frame.reindex(index, fill_value=0)
+    frame[f"net_{ROLLING_WINDOW}d_avg"] = frame["net"].rolling(ROLLING_WINDOW, min_periods=1).mean()
+    return frame.loc[start:]
+
+
+def resample_frame(frame, rule):
+    # Weekly/monthly buckets: per-day averages for amounts, sums for entry counts
+    if rule is None:
+        return frame
+    aggregations = {column: ("sum" if column in COUNT_COLUMNS else "mean") for column in frame.columns}
+    return frame.resample(rule, label="left", closed="left").agg(aggregations)
+
+
+def summary_table(frame, rule=None):
+    view = resample_frame(frame, rule)
+    table = pd.DataFrame({
+        "Date": view.index.strftime(DATE_LABELS[rule]),
+        "Consumed": view["calories"].round().astype(int).to_numpy(),
+        "Burned": view["burned"].round().astype(int).to_numpy(),
+        "Net": view["net"].round().astype(int).to_numpy(),
+        "Water (ml)": view["water_ml"].round().astype(int).to_numpy(),
+        "Meals": view["meal_count"].astype(int).to_numpy(),
+        "Workouts": view["workout_count"].astype(int).to_numpy(),
+    })
+    if rule is None:
+        table[f"Net ({ROLLING_WINDOW}d avg)"] = view[f"net_{ROLLING_WINDOW}d_avg"].round().astype(int).to_numpy()
+    return table
+
+
+def macro_stats(frame, user_data):
+    # Per-metric statistics over the days that have at least one meal
+    logged = frame[frame["meal_count"].to_numpy() > 0]
+    goals = {
+        "calories": user_data["daily_calorie_goal"],
+        "protein": user_data["daily_protein_goal"],
+        "carbs": user_data["daily_carbs_goal"],
+        "fat": user_data["daily_fat_goal"],
+        "water_ml": user_data["daily_water_goal"],
+    }
+    labels = {"calories": "Calories", "protein": "Protein (g)", "carbs": "Carbs (g)", "fat": "Fat (g)", "water_ml": "Water (ml)"}
+    rows = []
+    for column, goal in goals.items():
+        values = logged[column].to_numpy(dtype="float64")
+        if column == "calories":
+            hit = logged["net"].to_numpy(dtype="float64") <= goal
+        elif column == "water_ml":
+            hit = values >= goal
+        else:
+            hit = np.abs(values - goal) <= goal * 0.1
+        empty = values.size == 0
+        rows.append({
+            "Metric": labels[column],
+            "Goal": goal,
+            "Mean": 0.0 if empty else round(float(values.mean()), 1),
+            "Median": 0.0 if empty else round(float(np.median(values)), 1),
+            "Std": 0.0 if empty else round(float(values.std()), 1),
+            "Min": 0.0 if empty else float(values.min()),
+            "Max": 0.0 if empty else float(values.max()),
+            "Days on Goal (%)": 0.0 if empty else round(float(hit.mean() * 100), 1),
+        })
+    return pd.DataFrame(rows)
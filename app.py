@@ -1,9 +1,30 @@
 import streamlit as st
-import pandas as pd
-import json
-from datetime import datetime, timedelta
+import html
+import io
+import logging
 import os
+import pandas as pd
+from datetime import datetime
 import random
+from contextlib import contextmanager
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import achievements
+import metrics
+import perf
+from achievements import ACHIEVEMENTS
+from analytics import ANALYTICS_RANGES, RESAMPLE_RULES, build_daily_frame, macro_stats, range_start, select_range, summary_table
+from autosave import WriteBehind
+from charts import trend_charts, weight_chart
+from cache import VIEW_CACHE_ENTRIES, DocumentCache, edit_stamp, touch
+from exporter import EXPORT_FORMATS, available_formats, export_bytes
+from food_catalog import FoodCatalog, find_catalog_file
+from importer import CSV_COLUMNS, import_rows, read_rows
+from storage import DEFAULT_USER, open_storage
+from tracker import (
+    Tracker, ensure_daily_totals, ensure_streaks, get_current_rank, new_user_data, rebuild_daily_totals, save_merging,
+)
+
+perf.start_rerun()
 
 # Set page config
 st.set_page_config(
@@ -146,6 +167,7 @@ st.markdown("""
     }
     </style>
 """, unsafe_allow_html=True)
+perf.lap("css")
 
 # Motivational quotes
 NUTRITION_QUOTES = [
@@ -251,252 +273,342 @@ WATER_SIZES = {
     "Custom": 0,
 }
 
-ACHIEVEMENTS = {
-    "first_meal": {"name": "First Bite", "description": "Log your first meal", "emoji": "🍽️"},
-    "five_meals": {"name": "Meal Logger", "description": "Log 5 meals", "emoji": "📝"},
-    "first_workout": {"name": "Fitness Start", "description": "Log your first workout", "emoji": "💪"},
-    "first_water": {"name": "Hydration Hero", "description": "Log your first water intake", "emoji": "💧"},
-    "water_goal": {"name": "Aqua Master", "description": "Drink 2L+ water in one day", "emoji": "🌊"},
-    "on_target": {"name": "Perfect Day", "description": "Stay within calorie goal", "emoji": "🎯"},
-    "week_on_track": {"name": "Consistency", "description": "7 days on target", "emoji": "📅"},
-    "macro_master": {"name": "Macro Master", "description": "Hit macros within 10%", "emoji": "🎪"},
-    "high_protein": {"name": "Protein Powerhouse", "description": "100g+ protein in one day", "emoji": "🥚"},
-    "workout_warrior": {"name": "Workout Warrior", "description": "Complete 5 workouts", "emoji": "🔥"},
-}
-
-RANK_SYSTEM = [
-    {"rank": "BEGINNER", "min_points": 0, "emoji": "🌱"},
-    {"rank": "APPRENTICE", "min_points": 100, "emoji": "👨‍🍳"},
-    {"rank": "CHEF", "min_points": 250, "emoji": "🍽️"},
-    {"rank": "MASTER CHEF", "min_points": 500, "emoji": "👨‍🍳"},
-    {"rank": "NUTRITION EXPERT", "min_points": 1000, "emoji": "💚"},
-    {"rank": "HEALTH CHAMPION", "min_points": 2000, "emoji": "🏆"},
-    {"rank": "LEGEND", "min_points": 5000, "emoji": "👑"},
-]
+# Entry lists longer than this are shown a page at a time
+ENTRY_PAGE_SIZE = int(os.environ.get("CALORIE_ENTRY_PAGE_SIZE", "50"))
 
 # Data storage
-DATA_DIR = "calorie_data"
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
+@st.cache_resource
+def open_user_storage(user_id):
+    return metrics.watch_storage(open_storage(user=user_id))
+
+def get_current_user():
+    # Each browser session picks its profile with ?user=<id>; sessions without one share DEFAULT_USER
+    if "user_id" not in st.session_state:
+        st.session_state.user_id = st.query_params.get("user") or DEFAULT_USER
+    return st.session_state.user_id
+
+def get_storage():
+    return open_user_storage(get_current_user())
+
+@st.cache_resource
+def get_document_cache():
+    # Parsed documents shared by all sessions, so extra tabs and cold sessions skip the disk
+    return DocumentCache()
+
+@st.cache_resource
+def open_autosave(user_id):
+    # One background writer per user, shared by every session editing that document
+    storage = open_user_storage(user_id)
+    cache = get_document_cache()
+    def flushed(user_data):
+        revision, _ = storage.revision()
+        cache.put(user_id, revision, user_data)
+    return WriteBehind(storage, on_flush=flushed)
 
-def save_data(filename="tracker.json"):
+def get_autosave():
+    return open_autosave(get_current_user())
+
+@contextmanager
+def editing(changes=True):
+    # Held while changing user_data so the background writer never serializes a half-made
+    # edit. On the way out the document gets a new edit stamp, so views cached under the
+    # old one are recomputed; changes=False for blocks that only sometimes change it.
+    with get_autosave().lock:
+        try:
+            yield
+        finally:
+            if changes:
+                touch(st.session_state.user_data)
+
+def save_data(changed=None, force=False):
+    # Queued for the background writer, which folds bursts of changes into one write and
+    # merges in anything another tab, process or the importer saved meanwhile (force
+    # discards that instead, for reset)
+    with perf.timed("save_data"):
+        get_autosave().submit(st.session_state.user_data, changed, force)
+    return True
+
+def flush_data():
+    # Blocks until everything queued is on disk
+    with perf.timed("flush_data"):
+        return get_autosave().flush()
+
+def load_history(start=None):
+    # Reads older months into the session's document when a view reaches back to `start`
+    # (None for all history); a damaged month is reported instead of failing the page
     try:
-        filepath = os.path.join(DATA_DIR, filename)
-        with open(filepath, 'w') as f:
-            json.dump(st.session_state.user_data, f, indent=4)
+        cold = len(st.session_state.user_data.get("cold_months", ()))
+        with perf.timed("load_history"):
+            get_storage().load_history(st.session_state.user_data, start, editing())
+        if len(st.session_state.user_data.get("cold_months", ())) != cold:
+            # The shared document grew; its cached size is re-estimated
+            get_document_cache().resize(get_current_user(), st.session_state.user_data)
         return True
-    except:
+    except Exception as e:
+        st.warning(f"⚠️ Some older history could not be read: {e}")
         return False
 
-def load_data(filename="tracker.json"):
+def refresh_data():
+    # Merges in what other processes saved since this session's last save (the ingestion
+    # API, the importer); entries logged today and not yet written are kept
+    today = get_today_key()
     try:
-        filepath = os.path.join(DATA_DIR, filename)
-        if os.path.exists(filepath):
-            with open(filepath, 'r') as f:
-                return json.load(f)
+        with perf.timed("refresh_data"):
+            get_autosave().refresh(
+                st.session_state.user_data, [(section, today) for section in ("meals", "workouts", "water_intake", "weight_log")]
+            )
+    except Exception as e:
+        st.sidebar.warning(f"⚠️ Newer saved data could not be read: {e}")
+
+def read_section(user_data, section):
+    # Copy of one history section of the shared document, taken under its lock: another
+    # session logging or merging meanwhile cannot change it while a view iterates it
+    with get_autosave().lock:
+        return dict(user_data[section])
+
+# Derived views, cached per process under the document's edit stamp: a rerun that only
+# navigates finds them as they were. The document itself is passed unhashed.
+@st.cache_data(max_entries=VIEW_CACHE_ENTRIES, show_spinner=False)
+def analytics_views(user_id, stamp, today, range_label, granularity, _user_data):
+    metrics.CACHE_MISSES.labels("analytics_views").inc()
+    daily_frame = build_daily_frame(read_section(_user_data, "daily_totals"))
+    range_frame = select_range(daily_frame, ANALYTICS_RANGES[range_label], today)
+    days_logged = int((range_frame["meal_count"] > 0).sum())
+    rule = RESAMPLE_RULES[granularity]
+    return days_logged, summary_table(range_frame, rule), macro_stats(range_frame, _user_data), trend_charts(range_frame, _user_data, rule)
+
+@st.cache_data(max_entries=VIEW_CACHE_ENTRIES, show_spinner=False)
+def weight_history_view(user_id, stamp, _user_data):
+    metrics.CACHE_MISSES.labels("weight_history_view").inc()
+    weight_log = read_section(_user_data, "weight_log")
+    recent = sorted(weight_log, reverse=True)[:10]
+    return pd.DataFrame({"Date": recent, "Weight (kg)": [weight_log[date] for date in recent]})
+
+@st.cache_data(max_entries=VIEW_CACHE_ENTRIES, show_spinner=False)
+def weight_chart_view(user_id, stamp, start, target_weight, _user_data):
+    metrics.CACHE_MISSES.labels("weight_chart_view").inc()
+    return weight_chart(read_section(_user_data, "weight_log"), target_weight, start)
+
+@st.cache_resource
+def get_food_catalog():
+    # Built once per process and shared by every session
+    path = find_catalog_file()
+    if path:
+        return FoodCatalog.from_file(path)
+    return FoodCatalog.from_categories(COMMON_FOODS)
+
+def load_data():
+    # None only when nothing was ever saved; a failed read leaves the reason in
+    # st.session_state.load_error so it is never mistaken for a new profile
+    st.session_state.pop("load_error", None)
+    try:
+        storage = get_storage()
+        revision, _ = storage.revision()
+        cached = get_document_cache().get(get_current_user(), revision)
+        if cached is not None:
+            return cached
+        with perf.timed("load_data"):
+            loaded = storage.load()
+        if loaded:
+            if "daily_totals" not in loaded or "streak_last_date" not in loaded or achievements.needs_replay(loaded):
+                # Backfills below derive from all of history, not only the recent months
+                storage.load_history(loaded)
+            backfilled = ensure_daily_totals(loaded)
+            backfilled = ensure_streaks(loaded) or backfilled
+            if storage.recovered_from:
+                # Rewrite a healthy snapshot over the damaged one
+                st.session_state.recovered_from = storage.recovered_from
+                backfilled = True
+            if backfilled:
+                save_merging(storage, loaded)
+                revision, _ = storage.revision()
+            get_document_cache().put(get_current_user(), revision, loaded)
+        return loaded
+    except Exception as e:
+        st.session_state.load_error = str(e)
+        return None
+
+@st.cache_resource
+def start_metrics_server():
+    # Prometheus text format on CALORIE_METRICS_PORT, once per process. A port already in
+    # use (another app process with the same setting) leaves the endpoint off, warned once.
+    if not metrics.METRICS_PORT:
         return None
-    except:
+    try:
+        return metrics.start_server(metrics.METRICS_PORT)
+    except (OSError, ValueError) as e:
+        logging.getLogger(__name__).warning("Metrics endpoint on port %s not started: %s", metrics.METRICS_PORT, e)
         return None
 
+start_metrics_server()
+ctx = get_script_run_ctx()
+if ctx is not None:
+    metrics.session_seen(ctx.session_id)
+
 # Initialize session state
 if "user_data" not in st.session_state:
     loaded = load_data()
     if loaded:
         st.session_state.user_data = loaded
+    elif st.session_state.get("load_error"):
+        # Starting a blank profile here would overwrite the saved history on the next save
+        st.error(
+            f"⚠️ Your saved data could not be read: {st.session_state.load_error}. "
+            "Nothing has been changed on disk; fix or restore the files, then reload this page."
+        )
+        st.stop()
     else:
-        st.session_state.user_data = {
-            "username": "Nutritionist",
-            "level": 1,
-            "experience": 0,
-            "exp_needed": 100,
-            "rank": "BEGINNER",
-            "rank_points": 0,
-            "daily_calorie_goal": 2000,
-            "daily_protein_goal": 150,
-            "daily_carbs_goal": 225,
-            "daily_fat_goal": 65,
-            "daily_water_goal": 2000,
-            "target_weight": 77,
-            "current_weight": 82,
-            "meals": {},
-            "workouts": {},
-            "water_intake": {},
-            "weight_log": {},
-            "achievements": [],
-            "last_saved": None,
-            "total_meals_logged": 0,
-            "total_workouts": 0,
-            "total_water_logged": 0,
-            "best_streak": 0,
-            "daily_bonus_claimed": False,
-            "last_bonus_date": None,
-        }
-
-def get_current_rank(rank_points):
-    for i in range(len(RANK_SYSTEM) - 1, -1, -1):
-        if rank_points >= RANK_SYSTEM[i]["min_points"]:
-            return RANK_SYSTEM[i]
-    return RANK_SYSTEM[0]
+        st.session_state.user_data = new_user_data()
+perf.lap("session_init")
 
-def get_today_key():
-    return datetime.now().strftime("%Y-%m-%d")
+def get_tracker():
+    return Tracker(st.session_state.user_data, intern=get_storage().names)
 
-def add_experience(exp_amount):
-    user = st.session_state.user_data
-    user["experience"] += exp_amount
-    
-    leveled_up = False
-    while user["experience"] >= user["exp_needed"]:
-        user["experience"] -= user["exp_needed"]
-        user["level"] += 1
-        user["rank_points"] += 20
-        user["exp_needed"] = 100 + (user["level"] - 1) * 50
-        leveled_up = True
-    
-    new_rank = get_current_rank(user["rank_points"])
-    user["rank"] = new_rank["rank"]
-    
-    return leveled_up
+def get_today_key():
+    return get_tracker().today()
 
 def log_meal(meal_name, calories, protein, carbs, fat):
-    today = get_today_key()
-    if today not in st.session_state.user_data["meals"]:
-        st.session_state.user_data["meals"][today] = []
-    
-    st.session_state.user_data["meals"][today].append({
-        "name": meal_name,
-        "calories": calories,
-        "protein": protein,
-        "carbs": carbs,
-        "fat": fat,
-        "time": datetime.now().strftime("%H:%M")
-    })
-    
-    st.session_state.user_data["total_meals_logged"] += 1
-    add_experience(10)
-    save_data()
+    with editing():
+        changed, earned = get_tracker().log_meal(meal_name, calories, protein, carbs, fat)
+        announce_achievements(earned)
+    save_data(changed)
 
 def log_workout(workout_name, calories_burned):
-    today = get_today_key()
-    if today not in st.session_state.user_data["workouts"]:
-        st.session_state.user_data["workouts"][today] = []
-    
-    st.session_state.user_data["workouts"][today].append({
-        "name": workout_name,
-        "calories_burned": calories_burned,
-        "time": datetime.now().strftime("%H:%M")
-    })
-    
-    st.session_state.user_data["total_workouts"] += 1
-    add_experience(15)
-    save_data()
+    with editing():
+        changed, earned = get_tracker().log_workout(workout_name, calories_burned)
+        announce_achievements(earned)
+    save_data(changed)
 
 def log_water(water_ml):
-    today = get_today_key()
-    if today not in st.session_state.user_data["water_intake"]:
-        st.session_state.user_data["water_intake"][today] = []
-    
-    st.session_state.user_data["water_intake"][today].append({
-        "amount_ml": water_ml,
-        "time": datetime.now().strftime("%H:%M")
-    })
-    
-    st.session_state.user_data["total_water_logged"] += 1
-    add_experience(5)
-    save_data()
+    with editing():
+        changed, earned = get_tracker().log_water(water_ml)
+        announce_achievements(earned)
+    save_data(changed)
+
+def announce_achievements(earned):
+    if earned:
+        st.session_state.setdefault("new_achievements", []).extend(earned)
 
 def get_today_meals():
-    today = get_today_key()
-    return st.session_state.user_data["meals"].get(today, [])
+    return get_tracker().entries("meals")
 
 def get_today_workouts():
-    today = get_today_key()
-    return st.session_state.user_data["workouts"].get(today, [])
+    return get_tracker().entries("workouts")
 
 def get_today_water():
-    today = get_today_key()
-    return st.session_state.user_data["water_intake"].get(today, [])
+    return get_tracker().entries("water_intake")
 
 def get_today_water_total():
-    water_entries = get_today_water()
-    return sum(w["amount_ml"] for w in water_entries)
+    return get_tracker().day_totals()["water_ml"]
 
 def get_today_totals():
-    meals = get_today_meals()
-    totals = {"calories": 0, "protein": 0, "carbs": 0, "fat": 0}
-    
-    for meal in meals:
-        totals["calories"] += meal["calories"]
-        totals["protein"] += meal["protein"]
-        totals["carbs"] += meal["carbs"]
-        totals["fat"] += meal["fat"]
-    
-    return totals
+    return get_tracker().day_totals()
+
+def show_entries(key, entries, render, empty_message):
+    # Sends a whole page of entries as one markdown element instead of one per entry.
+    # render(number, entry) returns that entry's markup, numbered from 1.
+    if not entries:
+        st.info(empty_message)
+        return
+    start = 0
+    if len(entries) > ENTRY_PAGE_SIZE:
+        pages = (len(entries) + ENTRY_PAGE_SIZE - 1) // ENTRY_PAGE_SIZE
+        page_no = st.number_input("Page", min_value=1, max_value=pages, value=pages, key=f"{key}_page")
+        start = (page_no - 1) * ENTRY_PAGE_SIZE
+        st.caption(f"Showing {start + 1}–{min(start + ENTRY_PAGE_SIZE, len(entries))} of {len(entries)}")
+    shown = entries[start:start + ENTRY_PAGE_SIZE]
+    st.markdown("".join(render(number, entry) for number, entry in enumerate(shown, start + 1)), unsafe_allow_html=True)
+
+def meal_item(number, meal):
+    return (
+        f"<div class='food-item'><b>{html.escape(meal['name'])}</b> ({meal['time']})<br>"
+        f"{meal['calories']} cal | P:{meal['protein']}g | C:{meal['carbs']}g | F:{meal['fat']}g</div>"
+    )
+
+def workout_item(number, workout):
+    return (
+        f"<div class='workout-item'><b>{html.escape(workout['name'])}</b> ({workout['time']})<br>"
+        f"🔥 Burned: {workout['calories_burned']} calories</div>"
+    )
+
+def water_item(number, water):
+    return f"<div class='water-item'><b>💧 {water['amount_ml']} ml</b> ({water['time']})</div>"
+
+def water_line(number, water):
+    return f"{number}. {water['amount_ml']} ml at {water['time']}\n"
 
 def get_today_burned():
-    workouts = get_today_workouts()
-    burned = sum(w["calories_burned"] for w in workouts)
-    return burned
+    return get_tracker().day_totals()["burned"]
 
 def get_net_calories():
     today_totals = get_today_totals()
-    today_burned = get_today_burned()
-    return today_totals["calories"] - today_burned
+    return today_totals["calories"] - today_totals["burned"]
 
 def get_meal_streak():
-    today = datetime.now()
-    streak = 0
-    
-    for i in range(100):
-        check_date = (today - timedelta(days=i)).strftime("%Y-%m-%d")
-        if check_date in st.session_state.user_data["meals"]:
-            meals = st.session_state.user_data["meals"][check_date]
-            if meals:
-                streak += 1
-            else:
-                break
-        else:
-            break
-    
-    if streak > st.session_state.user_data.get("best_streak", 0):
-        st.session_state.user_data["best_streak"] = streak
-    
-    return streak
+    return get_tracker().streak()
 
 def claim_daily_bonus():
-    today = get_today_key()
-    last_claimed = st.session_state.user_data.get("last_bonus_date")
-    
-    if last_claimed != today:
-        add_experience(25)
-        st.session_state.user_data["daily_bonus_claimed"] = True
-        st.session_state.user_data["last_bonus_date"] = today
-        save_data()
-        return True
-    return False
+    with editing():
+        claimed = get_tracker().claim_daily_bonus()
+    if claimed:
+        save_data([])
+    return claimed
 
 # Sidebar
 st.sidebar.title("🍎 Calorie Tracker")
+st.sidebar.caption(f"👤 Profile: {get_current_user()}")
+recovered_from = st.session_state.pop("recovered_from", None)
+if recovered_from:
+    st.sidebar.warning(f"⚠️ The latest save was damaged; restored from {recovered_from}")
+damaged_segments = getattr(get_storage(), "damaged_segments", ())
+if damaged_segments:
+    st.sidebar.warning(
+        "⚠️ Damaged history set aside, only the days still loaded were kept: "
+        + ", ".join(os.path.basename(path) for path in damaged_segments)
+    )
 
 col_save1, col_save2 = st.sidebar.columns(2)
 with col_save1:
     if st.button("💾 Save", use_container_width=True):
-        if save_data():
+        with editing():
             st.session_state.user_data["last_saved"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        save_data()
+        if flush_data():
             st.sidebar.success("✅ Saved!")
+        else:
+            st.sidebar.error("Save failed, will retry in the background")
 
 with col_save2:
     if st.button("📥 Load", use_container_width=True):
+        flush_data()
         loaded = load_data()
         if loaded:
             st.session_state.user_data = loaded
             st.sidebar.success("✅ Loaded!")
             st.rerun()
+        elif st.session_state.get("load_error"):
+            st.sidebar.error(f"Load failed: {st.session_state.load_error}")
 
 st.sidebar.divider()
 
+refresh_data()
+
+# The background writer backs off after a failed save; say so instead of failing silently
+autosave_error = get_autosave().last_error
+if autosave_error:
+    st.sidebar.warning(f"⚠️ Recent changes are not saved yet, retrying in the background: {autosave_error}")
+
 # Daily bonus
 today = get_today_key()
+with editing(changes=False):
+    replayed, rollover_earned = get_tracker().start_day()
+    if replayed or rollover_earned:
+        touch(st.session_state.user_data)
+if replayed:
+    save_data()
+if rollover_earned:
+    announce_achievements(rollover_earned)
+    save_data([])
 if st.session_state.user_data.get("last_bonus_date") != today:
     if st.sidebar.button("🎁 Daily Bonus (+25 XP)", use_container_width=True):
         if claim_daily_bonus():
@@ -508,40 +620,252 @@ else:
 st.sidebar.divider()
 
 page = st.sidebar.radio("Navigation", ["🏠 Home", "🍽️ Log Meal", "🏋️ Log Workout", "💧 Log Water", "📊 Analytics", "⚖️ Weight", "🏆 Achievements", "⚙️ Settings"])
+perf.lap("sidebar")
 
-# Main Header
-col1, col2, col3 = st.columns([2, 2, 1])
+# Logging areas are fragments: picking a food or typing reruns only the fragment, and a
+# log button's callback reruns just that fragment and the header cards
+def logged(fragment, notice, balloons=False):
+    st.session_state.log_notice = ("success", notice, balloons)
+    st.rerun(["header", fragment])
 
-with col1:
-    st.markdown(f"""
-    <div class='level-container'>
-        <h2>🍎 LEVEL {st.session_state.user_data['level']}</h2>
-        <p>Experience: {st.session_state.user_data['experience']}/{st.session_state.user_data['exp_needed']}</p>
-    </div>
-    """, unsafe_allow_html=True)
+def log_rejected(fragment, message):
+    st.session_state.log_notice = ("error", message, False)
+    st.rerun(fragment)
+
+def show_log_notice():
+    notice = st.session_state.pop("log_notice", None)
+    if notice:
+        kind, message, balloons = notice
+        if kind == "success":
+            st.success(message)
+            if balloons:
+                st.balloons()
+        else:
+            st.error(message)
+
+def log_food_clicked(food):
+    log_meal(food["name"], food["calories"], food["protein"], food["carbs"], food["fat"])
+    logged("meal_log", f"✅ Logged {food['name']}!", balloons=True)
+
+def log_custom_food_clicked():
+    food_name = st.session_state.custom_food_name
+    if food_name:
+        log_meal(food_name, st.session_state.custom_calories, st.session_state.custom_protein, st.session_state.custom_carbs, st.session_state.custom_fat)
+        logged("meal_log", f"✅ Logged {food_name}!", balloons=True)
+    else:
+        log_rejected("meal_log", "Please enter a food name")
+
+def log_workout_clicked(workout):
+    log_workout(workout["name"], workout["calories_burned"])
+    logged("workout_log", f"✅ Logged {workout['name']}! 🔥", balloons=True)
+
+def log_custom_workout_clicked():
+    workout_name = st.session_state.custom_workout_name
+    if workout_name:
+        log_workout(workout_name, st.session_state.custom_calories_burned)
+        logged("workout_log", f"✅ Logged {workout_name}! 🔥", balloons=True)
+    else:
+        log_rejected("workout_log", "Please enter a workout name")
+
+def log_water_clicked(ml):
+    log_water(ml)
+    logged("water_log", f"✅ Logged {ml}ml!")
+
+def log_custom_water_clicked():
+    water_size = st.session_state.water_size
+    custom_ml = st.session_state.get("custom_ml", 250) if water_size == "Custom" else WATER_SIZES[water_size]
+    if custom_ml > 0:
+        log_water(custom_ml)
+        logged("water_log", f"✅ Logged {custom_ml}ml of water!", balloons=True)
+    else:
+        log_rejected("water_log", "Please enter an amount greater than 0")
+
+@st.fragment(key="meal_log")
+@perf.fragment("meal_log")
+def meal_log():
+    show_log_notice()
+    tab_search, tab1, tab2 = st.tabs(["Search", "Quick Select", "Custom Entry"])
+    
+    with tab_search:
+        catalog = get_food_catalog()
+        st.write(f"### Search {len(catalog):,} foods")
+        
+        query = st.text_input("Food search", placeholder="e.g. chicken breast", label_visibility="collapsed")
+        results = catalog.search(query) if query else []
+        
+        if results:
+            result_idx = st.selectbox(
+                "Matches",
+                range(len(results)),
+                format_func=lambda i: f"{results[i]['name']} ({results[i]['calories']} cal)",
+            )
+            found_food = results[result_idx]
+            st.caption(f"P:{found_food['protein']}g | C:{found_food['carbs']}g | F:{found_food['fat']}g")
+            
+            st.button("✅ Log This Food", type="primary", key="log_search", on_click=log_food_clicked, args=(found_food,))
+        elif query:
+            st.info("No foods match your search.")
     
-    progress = st.session_state.user_data['experience'] / st.session_state.user_data['exp_needed']
-    st.progress(min(progress, 1.0))
+    with tab1:
+        st.write("### Select from common foods")
+        
+        category = st.selectbox("Food Category", list(COMMON_FOODS.keys()))
+        foods = COMMON_FOODS[category]
+        
+        selected_idx = st.selectbox("Food", range(len(foods)), format_func=lambda i: f"{foods[i]['name']} ({foods[i]['calories']} cal)")
+        selected_food = foods[selected_idx]
+        
+        st.button("✅ Log This Food", type="primary", key="log_quick", on_click=log_food_clicked, args=(selected_food,))
+    
+    with tab2:
+        st.write("### Enter custom food")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.text_input("Food Name", key="custom_food_name")
+            st.number_input("Calories", min_value=0, max_value=5000, value=100, key="custom_calories")
+        
+        with col2:
+            st.number_input("Protein (g)", min_value=0, max_value=500, value=10, key="custom_protein")
+            st.number_input("Carbs (g)", min_value=0, max_value=500, value=20, key="custom_carbs")
+        
+        st.number_input("Fat (g)", min_value=0, max_value=200, value=5, key="custom_fat")
+        
+        st.button("✅ Log Custom Food", type="primary", key="log_custom", on_click=log_custom_food_clicked)
 
-with col2:
-    rank_info = get_current_rank(st.session_state.user_data['rank_points'])
-    st.markdown(f"""
-    <div class='rank-container'>
-        <h2>{rank_info['emoji']} {rank_info['rank']}</h2>
-        <p>Rank Points: {st.session_state.user_data['rank_points']}</p>
-    </div>
-    """, unsafe_allow_html=True)
+@st.fragment(key="workout_log")
+@perf.fragment("workout_log")
+def workout_log():
+    show_log_notice()
+    tab1, tab2 = st.tabs(["Quick Select", "Custom Entry"])
+    
+    with tab1:
+        st.write("### Select from common workouts")
+        
+        category = st.selectbox("Workout Category", list(WORKOUTS.keys()))
+        workouts = WORKOUTS[category]
+        
+        selected_idx = st.selectbox("Workout", range(len(workouts)), format_func=lambda i: f"{workouts[i]['name']} ({workouts[i]['calories_burned']} cal)")
+        selected_workout = workouts[selected_idx]
+        
+        st.button("✅ Log This Workout", type="primary", key="log_quick_workout", on_click=log_workout_clicked, args=(selected_workout,))
+    
+    with tab2:
+        st.write("### Enter custom workout")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.text_input("Workout Name", key="custom_workout_name")
+        
+        with col2:
+            st.number_input("Calories Burned", min_value=0, max_value=1000, value=100, step=10, key="custom_calories_burned")
+        
+        st.button("✅ Log Custom Workout", type="primary", key="log_custom_workout", on_click=log_custom_workout_clicked)
 
-with col3:
-    current_weight_display = float(st.session_state.user_data["current_weight"]) if isinstance(st.session_state.user_data["current_weight"], (int, float)) else 80.0
-    st.markdown(f"""
-    <div class='goal-container'>
-        <h4>🎯 Daily Goal</h4>
-        <p style='margin: 5px 0;'>{st.session_state.user_data['daily_calorie_goal']} cal</p>
-        <small>Weight: {current_weight_display} kg</small>
-    </div>
-    """, unsafe_allow_html=True)
+@st.fragment(key="water_log")
+@perf.fragment("water_log")
+def water_log():
+    today_water_total = get_today_water_total()
+    daily_goal = st.session_state.user_data["daily_water_goal"]
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.metric("Today's Water", f"{today_water_total} ml")
+    
+    with col2:
+        st.metric("Daily Goal", f"{daily_goal} ml")
+    
+    water_percent = (today_water_total / daily_goal) * 100
+    st.progress(min(water_percent / 100, 1.0), text=f"{water_percent:.0f}% of daily goal")
+    show_log_notice()
+    
+    st.divider()
+    
+    # Quick water logging buttons
+    st.subheader("💧 Quick Add Water")
+    
+    col1, col2, col3, col4, col5 = st.columns(5)
+    
+    buttons = [
+        ("200ml", 200, col1),
+        ("250ml", 250, col2),
+        ("300ml", 300, col3),
+        ("500ml", 500, col4),
+        ("1L", 1000, col5),
+    ]
+    
+    for label, ml, col in buttons:
+        with col:
+            st.button(f"💧 {label}", use_container_width=True, on_click=log_water_clicked, args=(ml,))
+    
+    st.divider()
+    
+    # Custom water entry
+    st.subheader("📝 Custom Water Entry")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        water_size = st.selectbox("Quick Size", list(WATER_SIZES.keys()), key="water_size")
+    
+    with col2:
+        if water_size == "Custom":
+            st.number_input("Enter amount (ml)", min_value=0, max_value=5000, value=250, step=50, key="custom_ml")
+        else:
+            st.write(f"**{WATER_SIZES[water_size]} ml selected**")
+    
+    st.button("✅ Log This Water", type="primary", on_click=log_custom_water_clicked)
+    
+    st.divider()
+    
+    # Water history
+    st.subheader("📋 Today's Water History")
+    show_entries("water_log", get_today_water(), water_line, "No water logged yet!")
 
+
+# Main Header
+@st.fragment(key="header")
+@perf.fragment("header")
+def header_cards():
+    # Reruns on its own, next to the logging fragment, when an entry is logged
+    col1, col2, col3 = st.columns([2, 2, 1])
+    
+    with col1:
+        st.markdown(f"""
+        <div class='level-container'>
+            <h2>🍎 LEVEL {st.session_state.user_data['level']}</h2>
+            <p>Experience: {st.session_state.user_data['experience']}/{st.session_state.user_data['exp_needed']}</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        progress = st.session_state.user_data['experience'] / st.session_state.user_data['exp_needed']
+        st.progress(min(progress, 1.0))
+    
+    with col2:
+        rank_info = get_current_rank(st.session_state.user_data['rank_points'])
+        st.markdown(f"""
+        <div class='rank-container'>
+            <h2>{rank_info['emoji']} {rank_info['rank']}</h2>
+            <p>Rank Points: {st.session_state.user_data['rank_points']}</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    with col3:
+        current_weight_display = float(st.session_state.user_data["current_weight"]) if isinstance(st.session_state.user_data["current_weight"], (int, float)) else 80.0
+        st.markdown(f"""
+        <div class='goal-container'>
+            <h4>🎯 Daily Goal</h4>
+            <p style='margin: 5px 0;'>{st.session_state.user_data['daily_calorie_goal']} cal</p>
+            <small>Weight: {current_weight_display} kg</small>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    for ach_id in st.session_state.pop("new_achievements", []):
+        ach = ACHIEVEMENTS[ach_id]
+        st.toast(f"{ach['emoji']} Achievement unlocked: {ach['name']}!")
+
+header_cards()
 st.divider()
 
 # Daily motivation
@@ -551,15 +875,17 @@ st.markdown(f"""
 </div>
 """, unsafe_allow_html=True)
 
+perf.lap("header")
+
 # PAGE: Home
 if page == "🏠 Home":
     today_meals = get_today_meals()
     today_workouts = get_today_workouts()
     today_water = get_today_water()
-    today_water_total = get_today_water_total()
     today_totals = get_today_totals()
-    today_burned = get_today_burned()
-    net_calories = get_net_calories()
+    today_water_total = today_totals["water_ml"]
+    today_burned = today_totals["burned"]
+    net_calories = today_totals["calories"] - today_burned
     
     col1, col2, col3, col4, col5, col6 = st.columns(6)
     
@@ -569,10 +895,10 @@ if page == "🏠 Home":
         st.metric(f"{color} Remaining", f"{max(0, remaining)} cal")
     
     with col2:
-        st.metric("📝 Meals", len(today_meals))
+        st.metric("📝 Meals", today_totals["meal_count"])
     
     with col3:
-        st.metric("🏋️ Workouts", len(today_workouts))
+        st.metric("🏋️ Workouts", today_totals["workout_count"])
     
     with col4:
         st.metric("💧 Water", f"{today_water_total} ml")
@@ -675,219 +1001,40 @@ if page == "🏠 Home":
     
     # Today's meals
     st.subheader("🍽️ Today's Meals")
-    if today_meals:
-        for meal in today_meals:
-            st.markdown(f"""
-            <div class='food-item'>
-                <b>{meal['name']}</b> ({meal['time']})
-                <br>
-                {meal['calories']} cal | P:{meal['protein']}g | C:{meal['carbs']}g | F:{meal['fat']}g
-            </div>
-            """, unsafe_allow_html=True)
-    else:
-        st.info("No meals logged yet. Log your first meal to start!")
+    show_entries("home_meals", today_meals, meal_item, "No meals logged yet. Log your first meal to start!")
     
     st.divider()
     
     # Today's workouts
     st.subheader("🏋️ Today's Workouts")
-    if today_workouts:
-        for workout in today_workouts:
-            st.markdown(f"""
-            <div class='workout-item'>
-                <b>{workout['name']}</b> ({workout['time']})
-                <br>
-                🔥 Burned: {workout['calories_burned']} calories
-            </div>
-            """, unsafe_allow_html=True)
-    else:
-        st.info("No workouts logged yet. Add a workout to burn calories!")
+    show_entries("home_workouts", today_workouts, workout_item, "No workouts logged yet. Add a workout to burn calories!")
     
     st.divider()
     
     # Today's water intake
     st.subheader("💧 Today's Water Intake")
-    if today_water:
-        for water in today_water:
-            st.markdown(f"""
-            <div class='water-item'>
-                <b>💧 {water['amount_ml']} ml</b> ({water['time']})
-            </div>
-            """, unsafe_allow_html=True)
-    else:
-        st.info("No water logged yet. Start hydrating!")
+    show_entries("home_water", today_water, water_item, "No water logged yet. Start hydrating!")
 
 # PAGE: Log Meal
 elif page == "🍽️ Log Meal":
     st.subheader("🍽️ Log a Meal")
-    
-    tab1, tab2 = st.tabs(["Quick Select", "Custom Entry"])
-    
-    with tab1:
-        st.write("### Select from common foods")
-        
-        category = st.selectbox("Food Category", list(COMMON_FOODS.keys()))
-        foods = COMMON_FOODS[category]
-        
-        food_option = st.selectbox("Food", [f"{food['name']} ({food['calories']} cal)" for food in foods])
-        
-        selected_idx = [f"{food['name']} ({food['calories']} cal)" for food in foods].index(food_option)
-        selected_food = foods[selected_idx]
-        
-        if st.button("✅ Log This Food", type="primary", key="log_quick"):
-            log_meal(selected_food["name"], selected_food["calories"], selected_food["protein"], selected_food["carbs"], selected_food["fat"])
-            st.success(f"✅ Logged {selected_food['name']}!")
-            st.balloons()
-            st.rerun()
-    
-    with tab2:
-        st.write("### Enter custom food")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            food_name = st.text_input("Food Name")
-            calories = st.number_input("Calories", min_value=0, max_value=5000, value=100)
-        
-        with col2:
-            protein = st.number_input("Protein (g)", min_value=0, max_value=500, value=10)
-            carbs = st.number_input("Carbs (g)", min_value=0, max_value=500, value=20)
-        
-        fat = st.number_input("Fat (g)", min_value=0, max_value=200, value=5)
-        
-        if st.button("✅ Log Custom Food", type="primary", key="log_custom"):
-            if food_name:
-                log_meal(food_name, calories, protein, carbs, fat)
-                st.success(f"✅ Logged {food_name}!")
-                st.balloons()
-                st.rerun()
-            else:
-                st.error("Please enter a food name")
+    meal_log()
 
 # PAGE: Log Workout
 elif page == "🏋️ Log Workout":
     st.subheader("🏋️ Log a Workout")
-    
-    tab1, tab2 = st.tabs(["Quick Select", "Custom Entry"])
-    
-    with tab1:
-        st.write("### Select from common workouts")
-        
-        category = st.selectbox("Workout Category", list(WORKOUTS.keys()))
-        workouts = WORKOUTS[category]
-        
-        workout_option = st.selectbox("Workout", [f"{w['name']} ({w['calories_burned']} cal)" for w in workouts])
-        
-        selected_idx = [f"{w['name']} ({w['calories_burned']} cal)" for w in workouts].index(workout_option)
-        selected_workout = workouts[selected_idx]
-        
-        if st.button("✅ Log This Workout", type="primary", key="log_quick_workout"):
-            log_workout(selected_workout["name"], selected_workout["calories_burned"])
-            st.success(f"✅ Logged {selected_workout['name']}! 🔥")
-            st.balloons()
-            st.rerun()
-    
-    with tab2:
-        st.write("### Enter custom workout")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            workout_name = st.text_input("Workout Name")
-        
-        with col2:
-            calories_burned = st.number_input("Calories Burned", min_value=0, max_value=1000, value=100, step=10)
-        
-        if st.button("✅ Log Custom Workout", type="primary", key="log_custom_workout"):
-            if workout_name:
-                log_workout(workout_name, calories_burned)
-                st.success(f"✅ Logged {workout_name}! 🔥")
-                st.balloons()
-                st.rerun()
-            else:
-                st.error("Please enter a workout name")
+    workout_log()
 
 # PAGE: Log Water
 elif page == "💧 Log Water":
     st.subheader("💧 Log Water Intake")
-    
-    today_water_total = get_today_water_total()
-    daily_goal = st.session_state.user_data["daily_water_goal"]
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.metric("Today's Water", f"{today_water_total} ml")
-    
-    with col2:
-        st.metric("Daily Goal", f"{daily_goal} ml")
-    
-    water_percent = (today_water_total / daily_goal) * 100
-    st.progress(min(water_percent / 100, 1.0), text=f"{water_percent:.0f}% of daily goal")
-    
-    st.divider()
-    
-    # Quick water logging buttons
-    st.subheader("💧 Quick Add Water")
-    
-    col1, col2, col3, col4, col5 = st.columns(5)
-    
-    buttons = [
-        ("200ml", 200, col1),
-        ("250ml", 250, col2),
-        ("300ml", 300, col3),
-        ("500ml", 500, col4),
-        ("1L", 1000, col5),
-    ]
-    
-    for label, ml, col in buttons:
-        with col:
-            if st.button(f"💧 {label}", use_container_width=True):
-                log_water(ml)
-                st.success(f"✅ Logged {ml}ml!")
-                st.rerun()
-    
-    st.divider()
-    
-    # Custom water entry
-    st.subheader("📝 Custom Water Entry")
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        water_size = st.selectbox("Quick Size", list(WATER_SIZES.keys()))
-    
-    with col2:
-        if water_size == "Custom":
-            custom_ml = st.number_input("Enter amount (ml)", min_value=0, max_value=5000, value=250, step=50)
-        else:
-            custom_ml = WATER_SIZES[water_size]
-            st.write(f"**{custom_ml} ml selected**")
-    
-    if st.button("✅ Log This Water", type="primary"):
-        if custom_ml > 0:
-            log_water(custom_ml)
-            st.success(f"✅ Logged {custom_ml}ml of water!")
-            st.balloons()
-            st.rerun()
-        else:
-            st.error("Please enter an amount greater than 0")
-    
-    st.divider()
-    
-    # Water history
-    st.subheader("📋 Today's Water History")
-    today_water = get_today_water()
-    
-    if today_water:
-        for i, water in enumerate(today_water, 1):
-            st.write(f"{i}. {water['amount_ml']} ml at {water['time']}")
-    else:
-        st.info("No water logged yet!")
+    water_log()
 
 # PAGE: Analytics
 elif page == "📊 Analytics":
     st.subheader("📊 Analytics & Trends")
     
-    if not st.session_state.user_data["meals"]:
+    if not st.session_state.user_data["total_meals_logged"]:
         st.info("Log some meals to see analytics!")
     else:
         col1, col2, col3, col4, col5 = st.columns(5)
@@ -901,45 +1048,39 @@ elif page == "📊 Analytics":
         with col3:
             st.metric("💧 Water Logged", st.session_state.user_data["total_water_logged"])
         
-        with col4:
-            days_logged = len(st.session_state.user_data["meals"])
-            st.metric("📅 Days Logged", days_logged)
-        
         with col5:
             st.metric("🏆 Best Streak", st.session_state.user_data["best_streak"])
         
         st.divider()
         
-        # Last 7 days summary
-        st.subheader("📅 Last 7 Days Summary")
+        # Range summary
+        st.subheader("📅 Trends")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            range_label = st.selectbox("Range", list(ANALYTICS_RANGES.keys()))
+        with col2:
+            granularity = st.radio("Group by", list(RESAMPLE_RULES.keys()), horizontal=True)
         
-        summary_data = []
-        today = datetime.now()
+        load_history(range_start(ANALYTICS_RANGES[range_label], get_today_key()))
+        metrics.CACHE_LOOKUPS.labels("analytics_views").inc()
+        days_logged, df, df_macros, charts = analytics_views(
+            get_current_user(), edit_stamp(st.session_state.user_data), get_today_key(), range_label, granularity,
+            st.session_state.user_data,
+        )
         
-        for i in range(6, -1, -1):
-            date = (today - timedelta(days=i)).strftime("%Y-%m-%d")
-            date_display = (today - timedelta(days=i)).strftime("%a, %b %d")
-            meals = st.session_state.user_data["meals"].get(date, [])
-            workouts = st.session_state.user_data["workouts"].get(date, [])
-            water_entries = st.session_state.user_data["water_intake"].get(date, [])
-            
-            total_cal = sum(m["calories"] for m in meals)
-            total_burned = sum(w["calories_burned"] for w in workouts)
-            net = total_cal - total_burned
-            total_water = sum(w["amount_ml"] for w in water_entries)
-            
-            summary_data.append({
-                "Date": date_display,
-                "Consumed": total_cal,
-                "Burned": total_burned,
-                "Net": net,
-                "Water (ml)": total_water,
-                "Meals": len(meals),
-                "Workouts": len(workouts),
-            })
+        with col4:
+            st.metric("📅 Days Logged", days_logged, help=f"Days with a meal, {range_label.lower()}")
+        
+        for tab, (title, figure) in zip(st.tabs(list(charts)), charts.items()):
+            with tab:
+                st.plotly_chart(figure, use_container_width=True, key=f"chart_{title}")
+        
+        st.dataframe(df, use_container_width=True, hide_index=True)
         
-        df = pd.DataFrame(summary_data)
-        st.dataframe(df, use_container_width=True)
+        st.subheader("💪 Macro Statistics")
+        st.caption("Computed over days with at least one logged meal")
+        st.dataframe(df_macros, use_container_width=True, hide_index=True)
 
 # PAGE: Weight
 elif page == "⚖️ Weight":
@@ -974,28 +1115,35 @@ elif page == "⚖️ Weight":
         target_weight = st.number_input("Target Weight (kg)", value=target_weight_value, min_value=20.0, max_value=300.0, step=0.1)
     
     if st.button("💾 Save Weight", type="primary"):
-        today = get_today_key()
-        st.session_state.user_data["current_weight"] = new_weight
-        st.session_state.user_data["target_weight"] = target_weight
-        st.session_state.user_data["weight_log"][today] = new_weight
-        save_data()
+        with editing():
+            changed, earned = get_tracker().log_weight(new_weight, target_weight)
+            announce_achievements(earned)
+        save_data(changed)
         st.success("✅ Weight saved!")
         st.rerun()
     
     st.divider()
     
-    # Weight history table
+    # Weight trend and history table
     if st.session_state.user_data["weight_log"]:
         st.subheader("📉 Weight History")
         
-        weight_data = []
-        for date in sorted(st.session_state.user_data["weight_log"].keys(), reverse=True)[:10]:
-            weight_data.append({
-                "Date": date,
-                "Weight (kg)": st.session_state.user_data["weight_log"][date]
-            })
+        weight_range = st.selectbox("Range", list(ANALYTICS_RANGES.keys()), index=len(ANALYTICS_RANGES) - 1, key="weight_range")
+        # The whole weight log is always in the snapshot; no older months to read
+        weight_start = range_start(ANALYTICS_RANGES[weight_range], get_today_key())
+        metrics.CACHE_LOOKUPS.labels("weight_chart_view").inc()
+        st.plotly_chart(
+            weight_chart_view(
+                get_current_user(), edit_stamp(st.session_state.user_data), weight_start,
+                st.session_state.user_data["target_weight"], st.session_state.user_data,
+            ),
+            use_container_width=True,
+        )
         
-        df_weight = pd.DataFrame(weight_data)
+        metrics.CACHE_LOOKUPS.labels("weight_history_view").inc()
+        df_weight = weight_history_view(
+            get_current_user(), edit_stamp(st.session_state.user_data), st.session_state.user_data
+        )
         st.dataframe(df_weight, use_container_width=True)
 
 # PAGE: Achievements
@@ -1047,7 +1195,7 @@ elif page == "🏆 Achievements":
 elif page == "⚙️ Settings":
     st.subheader("⚙️ Settings")
     
-    tab1, tab2 = st.tabs(["Goals", "Advanced"])
+    tab1, tab_data, tab2 = st.tabs(["Goals", "Data", "Advanced"])
     
     with tab1:
         st.write("### Nutrition Goals")
@@ -1066,43 +1214,74 @@ elif page == "⚙️ Settings":
         water_goal = st.number_input("Daily Water Goal (ml)", value=st.session_state.user_data["daily_water_goal"], min_value=500, max_value=5000, step=100)
         
         if st.button("💾 Save Goals", type="primary"):
-            st.session_state.user_data["daily_calorie_goal"] = calorie_goal
-            st.session_state.user_data["daily_protein_goal"] = protein_goal
-            st.session_state.user_data["daily_carbs_goal"] = carbs_goal
-            st.session_state.user_data["daily_fat_goal"] = fat_goal
-            st.session_state.user_data["daily_water_goal"] = water_goal
-            save_data()
+            with editing():
+                st.session_state.user_data["daily_calorie_goal"] = calorie_goal
+                st.session_state.user_data["daily_protein_goal"] = protein_goal
+                st.session_state.user_data["daily_carbs_goal"] = carbs_goal
+                st.session_state.user_data["daily_fat_goal"] = fat_goal
+                st.session_state.user_data["daily_water_goal"] = water_goal
+            save_data([])
             st.success("✅ Goals saved!")
     
+    with tab_data:
+        st.write("### Export History")
+        col1, col2 = st.columns(2)
+        with col1:
+            export_format = st.selectbox("Format", available_formats(), format_func=lambda fmt: fmt.upper())
+        with col2:
+            st.write("")
+            if st.button("📦 Prepare Export", use_container_width=True) and load_history():
+                st.session_state.export_file = (export_format, export_bytes(st.session_state.user_data, export_format))
+        
+        if st.session_state.get("export_file"):
+            prepared_format, payload = st.session_state.export_file
+            _, _, extension, mime = EXPORT_FORMATS[prepared_format]
+            st.download_button(
+                f"⬇️ Download {prepared_format.upper()} ({len(payload) / 1024:.0f} KB)",
+                data=payload,
+                file_name=f"calorie_tracker_{get_today_key()}.{extension}",
+                mime=mime,
+                on_click=lambda: st.session_state.pop("export_file", None),
+            )
+        
+        st.divider()
+        st.write("### Import History")
+        st.caption(f"CSV with columns {', '.join(CSV_COLUMNS)}, or JSON Lines with the same keys")
+        uploaded = st.file_uploader("History file", type=["csv", "jsonl"])
+        if uploaded is not None and st.button("📤 Import", type="primary") and load_history():
+            fmt = "csv" if uploaded.name.endswith(".csv") else "jsonl"
+            with editing():
+                summary = import_rows(st.session_state.user_data, read_rows(io.TextIOWrapper(uploaded, encoding="utf-8"), fmt))
+            save_data()
+            st.success(
+                f"✅ Imported {summary['meal']} meals, {summary['workout']} workouts, "
+                f"{summary['water']} water entries and {summary['weight']} weights"
+            )
+            if summary["errors"]:
+                st.warning(f"{len(summary['errors'])} rows rejected")
+                st.dataframe(pd.DataFrame(summary["errors"][:100], columns=["Line", "Error"]), hide_index=True)
+    
     with tab2:
+        if st.button("🧮 Rebuild Daily Totals", help="Recompute per-day totals from logged entries") and load_history():
+            with editing():
+                mismatched = rebuild_daily_totals(st.session_state.user_data)
+            if mismatched:
+                save_data()
+                st.warning(f"Rebuilt totals for {len(mismatched)} day(s): {', '.join(mismatched[:10])}")
+            else:
+                st.success("✅ Daily totals match logged entries")
+        
+        if st.button("🏅 Re-evaluate Achievements", help="Replay your whole history through the achievement rules") and load_history():
+            before = set(st.session_state.user_data["achievements"])
+            with editing():
+                earned = achievements.replay(st.session_state.user_data, get_today_key())
+            save_data()
+            st.success(f"✅ {len(earned)} achievement(s) earned, {len(set(earned) - before)} new")
+        
         if st.button("🔄 Reset All Data", type="secondary"):
             if st.checkbox("I'm sure"):
-                st.session_state.user_data = {
-                    "username": "Nutritionist",
-                    "level": 1,
-                    "experience": 0,
-                    "exp_needed": 100,
-                    "rank": "BEGINNER",
-                    "rank_points": 0,
-                    "daily_calorie_goal": 2000,
-                    "daily_protein_goal": 150,
-                    "daily_carbs_goal": 225,
-                    "daily_fat_goal": 65,
-                    "daily_water_goal": 2000,
-                    "target_weight": 77,
-                    "current_weight": 82,
-                    "meals": {},
-                    "workouts": {},
-                    "water_intake": {},
-                    "weight_log": {},
-                    "achievements": [],
-                    "last_saved": None,
-                    "total_meals_logged": 0,
-                    "total_workouts": 0,
-                    "total_water_logged": 0,
-                    "best_streak": 0,
-                }
-                save_data()
+                st.session_state.user_data = new_user_data()
+                save_data(force=True)
                 st.rerun()
         
         st.divider()
@@ -1122,5 +1301,30 @@ elif page == "⚙️ Settings":
         - 🎁 Daily Bonus XP
         """)
 
+perf.lap(f"page {page}")
+
 st.sidebar.divider()
 st.sidebar.write("**Made with 💚 for Health & Fitness**")
+
+show_perf = st.sidebar.checkbox("🛠️ Performance panel", key="perf_panel")
+perf.end_rerun(st.session_state.user_data, log=show_perf)
+if show_perf:
+    with st.sidebar.expander("⏱️ Rerun timings", expanded=True):
+        last = perf.recent()[-1]
+        st.caption(f"Last rerun {last['total_ms']:.1f} ms · user_data {last.get('user_data_bytes', 0) / 1024:.0f} KB")
+        st.dataframe(pd.DataFrame(perf.summary()), hide_index=True, use_container_width=True)
+        st.bar_chart(pd.Series(perf.histogram(), name="reruns"))
+        cache_stats = get_document_cache().stats()
+        st.caption(
+            f"Document cache: {cache_stats['documents']} docs, {cache_stats['used_mb']}/{cache_stats['budget_mb']} MB, "
+            f"hit ratio {cache_stats['hit_ratio']:.0%} ({cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+            f"{cache_stats['evictions']} evictions)"
+        )
+        autosave_stats = get_autosave().stats()
+        st.caption(
+            f"Autosave: {autosave_stats['queue_depth']} queued ({autosave_stats['pending_ms']:.0f} ms old), "
+            f"{autosave_stats['flushes']} flushes for {autosave_stats['submitted']} changes, "
+            f"write p50 {autosave_stats.get('flush_ms_p50', 0)} ms, lag max {autosave_stats.get('lag_ms_max', 0)} ms"
+            + (f" · last error: {autosave_stats['last_error']}" if autosave_stats["last_error"] else "")
+        )
+        st.caption(f"Logging to {perf.LOG_PATH}")
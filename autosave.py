@@ -0,0 +1,199 @@
+import atexit
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+from tracker import refresh_merging, save_merging
+
+# Changes submitted within this window after the first pending one are written together
+AUTOSAVE_WINDOW_MS = int(os.environ.get("CALORIE_AUTOSAVE_MS", "300"))
+
+# Flush latencies kept for stats()
+HISTORY = 200
+
+# A failed save is retried after the window, doubling per failure up to this many seconds
+RETRY_MAX_SECONDS = 30
+
+_queues = weakref.WeakSet()
+
+
+class _Pending:
+    # Changes to one document copy waiting to be written
+    __slots__ = ("document", "changed", "full", "force", "since", "due", "depth", "failures")
+
+    def __init__(self, document, now):
+        self.document = document
+        self.changed = set()
+        self.full = False
+        self.force = False
+        self.since = now
+        self.due = now
+        self.depth = 0
+        self.failures = 0
+
+
+class WriteBehind:
+    # Background saver for one user's documents. Callers edit a document while holding
+    # `lock` and submit() the days they touched; a writer thread coalesces everything
+    # submitted within the window into one save. The lock is held while the document is
+    # serialized or merged, never during file I/O, and only the writer thread (or an
+    # explicit flush) writes, so logging does not wait on the disk. Sessions of one user
+    # usually share a document; a session holding its own copy gets its own pending
+    # changes, written separately. Pending changes belong to the process, not a session:
+    # a closed tab's edits are still written, and everything left is flushed at exit.
+
+    def __init__(self, storage, window_ms=AUTOSAVE_WINDOW_MS, on_flush=None):
+        self.storage = storage
+        self.window = window_ms / 1000
+        self.on_flush = on_flush
+        self.lock = threading.RLock()
+        self._cond = threading.Condition()
+        self._flushing = threading.Lock()
+        # id(document) -> _Pending; the entry holds the document, so its id stays unique
+        self._pending = {}
+        self.submitted = 0
+        self.flushes = 0
+        self.failures = 0
+        self.last_error = None
+        self._latencies = deque(maxlen=HISTORY)
+        _queues.add(self)
+        threading.Thread(target=self._run, name="autosave", daemon=True).start()
+
+    def submit(self, document, changed=None, force=False):
+        # changed=None asks for a full snapshot; force saves over other writers' changes
+        with self._cond:
+            entry = self._pending.get(id(document))
+            if entry is None:
+                now = time.monotonic()
+                entry = self._pending[id(document)] = _Pending(document, now)
+                entry.due = now + self.window
+            if changed is None:
+                entry.full = True
+            else:
+                entry.changed.update(changed)
+            entry.force = entry.force or force
+            entry.depth += 1
+            self.submitted += 1
+            self._cond.notify()
+
+    def flush(self):
+        # Writes everything pending now, on the calling thread, retry delays ignored; False
+        # if a save failed, in which case its changes stay queued for a later attempt
+        with self._flushing:
+            with self._cond:
+                entries = list(self._pending.values())
+                self._pending.clear()
+            results = [self._save(entry) for entry in entries]
+        return all(results)
+
+    def _save(self, entry):
+        # Called with _flushing held, `entry` already taken out of _pending
+        changed = None if entry.full else sorted(entry.changed)
+        start = time.monotonic()
+        try:
+            save_merging(self.storage, entry.document, changed, entry.force, self.lock)
+            if self.on_flush is not None:
+                self.on_flush(entry.document)
+        except Exception as e:
+            self._requeue(entry, e)
+            return False
+        end = time.monotonic()
+        with self._cond:
+            self.flushes += 1
+            self.last_error = None
+            self._latencies.append(((end - start) * 1000, (end - entry.since) * 1000, entry.depth))
+        return True
+
+    def _requeue(self, entry, error):
+        # Puts a failed save back, merged with anything submitted for the document since,
+        # and backs off so a persistent error is not retried in a tight loop
+        with self._cond:
+            entry.failures += 1
+            delay = min(self.window * 2 ** entry.failures, RETRY_MAX_SECONDS)
+            newer = self._pending.get(id(entry.document))
+            if newer is not None:
+                entry.changed.update(newer.changed)
+                entry.full = entry.full or newer.full
+                entry.force = entry.force or newer.force
+                entry.depth += newer.depth
+            entry.due = time.monotonic() + delay
+            self._pending[id(entry.document)] = entry
+            self.failures += 1
+            self.last_error = repr(error)
+            self._cond.notify()
+
+    def refresh(self, document, days=()):
+        # Merges into `document` what other processes saved (the ingestion API, the
+        # importer); True if the document changed. Only the stored revision is read when
+        # nothing newer was saved. Never writes: while changes to the document are queued
+        # or a save is running, the writer thread's save merges the newer data instead.
+        # Entries added on `days` but not submitted yet survive the merge.
+        if self.storage.stored_revision() == document.get("revision", 0):
+            return False
+        with self._cond:
+            if id(document) in self._pending:
+                return False
+        if not self._flushing.acquire(blocking=False):
+            return False
+        try:
+            if not refresh_merging(self.storage, document, days, self.lock):
+                return False
+            if self.on_flush is not None:
+                self.on_flush(document)
+        finally:
+            self._flushing.release()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                entry = min(self._pending.values(), key=lambda entry: entry.due)
+                delay = entry.due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                key = id(entry.document)
+            with self._flushing:
+                with self._cond:
+                    entry = self._pending.pop(key, None)
+                if entry is not None:
+                    self._save(entry)
+
+    def stats(self):
+        # Queue depth plus flush latency: write time, and lag from the oldest change to disk
+        with self._cond:
+            latencies = list(self._latencies)
+            entries = list(self._pending.values())
+            oldest = min((entry.since for entry in entries), default=None)
+            pending_ms = (time.monotonic() - oldest) * 1000 if oldest is not None else 0
+            stats = {
+                "queue_depth": sum(entry.depth for entry in entries),
+                "pending_documents": len(entries),
+                "pending_days": "all" if any(entry.full for entry in entries) else sum(len(entry.changed) for entry in entries),
+                "pending_ms": round(pending_ms, 1),
+                "submitted": self.submitted,
+                "flushes": self.flushes,
+                "failures": self.failures,
+                "last_error": self.last_error,
+            }
+        if latencies:
+            writes = sorted(write for write, _, _ in latencies)
+            lags = sorted(lag for _, lag, _ in latencies)
+            stats["flush_ms_p50"] = round(writes[len(writes) // 2], 2)
+            stats["flush_ms_max"] = round(writes[-1], 2)
+            stats["lag_ms_p50"] = round(lags[len(lags) // 2], 1)
+            stats["lag_ms_max"] = round(lags[-1], 1)
+            stats["changes_per_flush"] = round(sum(depth for _, _, depth in latencies) / len(latencies), 2)
+        return stats
+
+
+def flush_all():
+    for queue in list(_queues):
+        queue.flush()
+
+
+atexit.register(flush_all)
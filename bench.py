@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date as date_type, datetime, timedelta
+
+from analytics import build_daily_frame, macro_stats, select_range, summary_table
+from entries import to_json, unpack_document
+from storage import DEFAULT_BACKEND, STORAGE_BACKENDS, open_storage
+from tracker import Tracker, backfill_streaks, new_user_data, rebuild_daily_totals, save_merging
+
+# Bump when a benchmark or the synthetic data changes meaning, so results are only
+# compared with results of the same suite
+SUITE_VERSION = 2
+
+DEFAULT_YEARS = (1, 3, 10)
+
+# Synthetic users end on this day, so a seed always produces the same document
+END_DATE = date_type(2026, 1, 1)
+
+SYNTHETIC_FOODS = [
+    ("Oatmeal (1 cup)", 150, 5, 27, 3), ("Eggs (2)", 155, 13, 1, 11), ("Banana", 105, 1, 27, 0),
+    ("Chicken Breast (100g)", 165, 31, 0, 4), ("Rice (1 cup)", 206, 4, 45, 0), ("Salad", 150, 5, 10, 10),
+    ("Salmon (100g)", 208, 20, 0, 13), ("Pasta (1 cup)", 220, 8, 43, 1), ("Apple", 95, 0, 25, 0),
+    ("Greek Yogurt (1 cup)", 130, 23, 9, 0), ("Almonds (1 oz)", 164, 6, 6, 14), ("Protein Shake", 120, 24, 3, 1),
+]
+SYNTHETIC_WORKOUTS = [("Running (30 min)", 300), ("Cycling (30 min)", 250), ("Weight Training (45 min)", 220), ("Yoga (60 min)", 180)]
+
+# Logging calls timed against the full document
+LOG_CALLS = 500
+
+# Result ratios (new / old) above this are reported by --compare
+REGRESSION_RATIO = 1.2
+
+
+class FakeClock:
+    # Injectable clock for Tracker: returns `now`, which the generator moves along
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def synthetic_user(years, seed=0):
+    # A user logging every day for `years` years up to END_DATE through the real Tracker,
+    # so totals, streaks, XP and achievements are what the app would have stored
+    rng = random.Random(seed)
+    user_data = new_user_data()
+    user_data["daily_totals"] = {}
+    clock = FakeClock(None)
+    tracker = Tracker(user_data, clock=clock)
+    day = END_DATE - timedelta(days=365 * years - 1)
+    weight = 90.0
+    while day <= END_DATE:
+        start = datetime(day.year, day.month, day.day, 7)
+        clock.now = start
+        tracker.start_day()
+        if rng.random() < 0.92:
+            for minute in sorted(rng.sample(range(14 * 60), rng.randint(2, 5))):
+                clock.now = start + timedelta(minutes=minute)
+                name, calories, protein, carbs, fat = rng.choice(SYNTHETIC_FOODS)
+                tracker.log_meal(name, calories, protein, carbs, fat)
+        if rng.random() < 0.45:
+            clock.now = start + timedelta(minutes=rng.randrange(14 * 60))
+            name, calories_burned = rng.choice(SYNTHETIC_WORKOUTS)
+            tracker.log_workout(name, calories_burned)
+        for minute in sorted(rng.sample(range(14 * 60), rng.randint(3, 8))):
+            clock.now = start + timedelta(minutes=minute)
+            tracker.log_water(rng.choice((200, 250, 300, 500)))
+        if day.weekday() == 0:
+            weight = max(60.0, weight - rng.uniform(-0.3, 0.5))
+            tracker.log_weight(round(weight, 1))
+        day += timedelta(days=1)
+    return user_data
+
+
+def _measure(func, repeat):
+    # Milliseconds per run; `func` gets a fresh setup value when it is a (setup, run) pair
+    setup, run = func if isinstance(func, tuple) else (None, func)
+    samples = []
+    for _ in range(repeat):
+        value = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(value) if setup is not None else run()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"repeat": repeat, "min_ms": round(min(samples), 3), "median_ms": round(statistics.median(samples), 3)}
+
+
+def _copy(user_data):
+    # Deep copy, entries as records, through the same JSON round trip the storage uses
+    return unpack_document(json.loads(json.dumps(user_data, default=to_json)))
+
+
+def _open_storage(backend, data_dir):
+    # Hot months follow the synthetic history's end, not the day the bench runs
+    storage = open_storage(backend, data_dir=data_dir)
+    storage.today = lambda: END_DATE
+    return storage
+
+
+def bench_dataset(years, backend, repeat, seed):
+    start = time.perf_counter()
+    user_data = synthetic_user(years, seed)
+    generate_ms = (time.perf_counter() - start) * 1000
+    entries = sum(len(day) for section in ("meals", "workouts", "water_intake") for day in user_data[section].values())
+    results = {}
+
+    def log_burst(copy):
+        clock = FakeClock(datetime(END_DATE.year, END_DATE.month, END_DATE.day, 20))
+        tracker = Tracker(copy, clock=clock)
+        for i in range(LOG_CALLS):
+            if i % 3 == 0:
+                tracker.log_meal("Eggs (2)", 155, 13, 1, 11)
+            elif i % 3 == 1:
+                tracker.log_workout("Running (30 min)", 300)
+            else:
+                tracker.log_water(250)
+    results[f"log x{LOG_CALLS}"] = _measure((lambda: _copy(user_data), log_burst), repeat)
+    results["streaks backfill"] = _measure((lambda: _copy(user_data), backfill_streaks), repeat)
+    results["daily totals rebuild"] = _measure((lambda: _copy(user_data), rebuild_daily_totals), repeat)
+
+    def analytics_summary():
+        frame = build_daily_frame(user_data["daily_totals"])
+        for days in (7, 30, 365, None):
+            range_frame = select_range(frame, days, END_DATE.isoformat())
+            summary_table(range_frame, "W" if days and days > 30 else None)
+            macro_stats(range_frame, user_data)
+    results["analytics summary"] = _measure(analytics_summary, repeat)
+
+    data_dir = tempfile.mkdtemp(prefix="calorie-bench-")
+    try:
+        def fresh_storage():
+            shutil.rmtree(data_dir, ignore_errors=True)
+            return _open_storage(backend, data_dir), _copy(user_data)
+        results["save full"] = _measure((fresh_storage, lambda pair: save_merging(pair[0], pair[1])), repeat)
+
+        def load(pair):
+            loaded = pair[0].load()
+            pair[0].load_history(loaded)
+        results["load full"] = _measure((lambda: (_open_storage(backend, data_dir), None), load), repeat)
+
+        storage = _open_storage(backend, data_dir)
+        stored = storage.load()
+        clock = FakeClock(datetime(END_DATE.year, END_DATE.month, END_DATE.day, 21))
+        tracker = Tracker(stored, clock=clock)
+
+        def save_one_entry():
+            changed, _ = tracker.log_water(250)
+            save_merging(storage, stored, changed)
+        results["save one entry"] = _measure(save_one_entry, repeat)
+        stored_bytes = sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(data_dir) for name in names
+        )
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return {
+        "years": years,
+        "days": len(user_data["daily_totals"]),
+        "entries": entries,
+        "stored_bytes": stored_bytes,
+        "generate_ms": round(generate_ms, 3),
+        "results": results,
+    }
+
+
+def _revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(years=DEFAULT_YEARS, backend=None, repeat=5, seed=0):
+    backend = backend or DEFAULT_BACKEND
+    return {
+        "suite_version": SUITE_VERSION,
+        "revision": _revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": backend,
+        "seed": seed,
+        "datasets": {f"{y}y": bench_dataset(y, backend, repeat, seed) for y in years},
+    }
+
+
+def compare(old, new):
+    # (dataset, benchmark, old ms, new ms, ratio) for every median both runs measured
+    rows = []
+    for name, dataset in new["datasets"].items():
+        previous = old["datasets"].get(name, {}).get("results", {})
+        for bench, result in dataset["results"].items():
+            if bench in previous and previous[bench]["median_ms"]:
+                ratio = result["median_ms"] / previous[bench]["median_ms"]
+                rows.append((name, bench, previous[bench]["median_ms"], result["median_ms"], ratio))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tracker core on synthetic multi-year users")
+    parser.add_argument("--years", type=int, nargs="+", default=list(DEFAULT_YEARS), help="dataset sizes in years (default: 1 3 10)")
+    parser.add_argument("--backend", choices=sorted(STORAGE_BACKENDS), help="storage backend (default: CALORIE_STORAGE or segments)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark; min and median are reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="where to write the results JSON")
+    parser.add_argument("--compare", help="earlier results JSON to compare medians against")
+    args = parser.parse_args()
+
+    results = run_suite(args.years, args.backend, args.repeat, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    for name, dataset in results["datasets"].items():
+        print(f"{name}: {dataset['days']} days, {dataset['entries']} entries, {dataset['stored_bytes']} bytes stored")
+        for bench, result in dataset["results"].items():
+            print(f"  {bench:<22} median {result['median_ms']:>10.2f} ms  min {result['min_ms']:>10.2f} ms")
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if old.get("suite_version") != SUITE_VERSION:
+            print(f"{args.compare} is from suite version {old.get('suite_version')}, not {SUITE_VERSION}; not compared")
+            return
+        if old.get("backend") != results["backend"]:
+            print(f"note: {args.compare} used the {old.get('backend')} backend, this run {results['backend']}")
+        for name, bench, old_ms, new_ms, ratio in compare(old, results):
+            flag = "  REGRESSION" if ratio > REGRESSION_RATIO else ""
+            print(f"{name} {bench:<22} {old_ms:>10.2f} -> {new_ms:>10.2f} ms ({ratio:.2f}x){flag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+from storage import DAY_SECTIONS, ENTRY_SECTIONS
+
+# Budget for parsed documents held by the process, in MB of estimated memory
+DOCUMENT_CACHE_MB = int(os.environ.get("CALORIE_CACHE_MB", "256"))
+
+# Memory of a parsed document, estimated from what it holds: bytes per logged entry
+# (slotted record and list slot) and per day in any history section (date key, dict
+# slot, entry list or totals row). Fitted with tracemalloc on synthetic histories.
+ENTRY_BYTES = 80
+DAY_BYTES = 240
+
+# Derived views (analytics frames, weight table) kept per process, least recently used dropped
+VIEW_CACHE_ENTRIES = 64
+
+# Edit stamps, unique within the process so a stamp is never reused for other content
+_stamps = itertools.count(1)
+
+
+_LOOKUPS = metrics.CACHE_LOOKUPS.labels("documents")
+_MISSES = metrics.CACHE_MISSES.labels("documents")
+
+
+class DocumentCache:
+    # Parsed user documents shared by every session in the process, keyed by user and
+    # checked against the backing files' revision. Least recently used documents are
+    # dropped once the estimated total exceeds the budget; sessions already holding a
+    # dropped document keep using it.
+
+    def __init__(self, budget_bytes=DOCUMENT_CACHE_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user, revision):
+        _LOOKUPS.inc()
+        with self._lock:
+            entry = self._entries.get(user)
+            if entry is None or entry[0] != revision:
+                self.misses += 1
+                _MISSES.inc()
+                return None
+            self._entries.move_to_end(user)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user, revision, document):
+        cost = document_bytes(document)
+        with self._lock:
+            previous = self._entries.pop(user, None)
+            if previous is not None:
+                self.used_bytes -= previous[2]
+            if cost > self.budget_bytes:
+                return
+            self._entries[user] = (revision, document, cost)
+            self.used_bytes += cost
+            self._evict()
+
+    def resize(self, user, document):
+        # Re-estimates a cached document that grew in place (older months read in)
+        cost = document_bytes(document)
+        with self._lock:
+            entry = self._entries.get(user)
+            if entry is None or entry[1] is not document:
+                return
+            self._entries[user] = (entry[0], document, cost)
+            self.used_bytes += cost - entry[2]
+            self._evict()
+
+    def _evict(self):
+        while self.used_bytes > self.budget_bytes:
+            _, (_, _, evicted_cost) = self._entries.popitem(last=False)
+            self.used_bytes -= evicted_cost
+            self.evictions += 1
+
+    def invalidate(self, user):
+        with self._lock:
+            entry = self._entries.pop(user, None)
+            if entry is not None:
+                self.used_bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "documents": len(self._entries),
+                "used_mb": round(self.used_bytes / 1024 / 1024, 2),
+                "budget_mb": round(self.budget_bytes / 1024 / 1024, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+def document_bytes(user_data):
+    # Other sessions may add days meanwhile; list() takes each section's values in one step
+    days = entries = 0
+    for section in DAY_SECTIONS:
+        values = list(user_data.get(section, {}).values())
+        days += len(values)
+        if section in ENTRY_SECTIONS:
+            entries += sum(map(len, values))
+    return days * DAY_BYTES + entries * ENTRY_BYTES
+
+
+def edit_stamp(user_data):
+    # Names the document's current content; views derived from it are cached under this.
+    # A merge replaces the document's contents, stamp included, so it gets a new one too.
+    stamp = user_data.get("edit_stamp")
+    if stamp is None:
+        stamp = user_data["edit_stamp"] = next(_stamps)
+    return stamp
+
+
+def touch(user_data):
+    # Call after every change to user_data, with the document lock held
+    user_data["edit_stamp"] = next(_stamps)
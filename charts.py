@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from analytics import ROLLING_WINDOW, resample_frame
+
+# Most points sent to the browser per chart line; longer series are downsampled
+CHART_POINTS = int(os.environ.get("CALORIE_CHART_POINTS", "400"))
+
+MACRO_COLORS = {"protein": "#4ECDC4", "carbs": "#FFD93D", "fat": "#FF6B6B"}
+
+
+def lttb(x, y, points):
+    # Largest-Triangle-Three-Buckets: indices of `points` samples keeping the line's
+    # shape. First and last are kept; from each bucket between them, the sample forming
+    # the largest triangle with the previous pick and the next bucket's average.
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    picked = np.empty(points, dtype=int)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(area.argmax())
+        picked[i + 1] = a
+    return picked
+
+
+def min_max(y, points):
+    # Indices of each bucket's lowest and highest sample, plus the first and last, so
+    # spikes and dips survive however long the series is
+    n = len(y)
+    if points >= n or points < 4:
+        return np.arange(n)
+    edges = np.linspace(0, n, (points - 2) // 2 + 1).astype(int)
+    picked = {0, n - 1}
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            picked.add(start + int(y[start:end].argmin()))
+            picked.add(start + int(y[start:end].argmax()))
+    return np.array(sorted(picked))
+
+
+def downsample(series, points=CHART_POINTS, method="lttb"):
+    # `series` indexed by date, cut to about `points` samples by "lttb" or "minmax"
+    series = series.dropna()
+    if len(series) <= points:
+        return series
+    y = series.to_numpy(dtype="float64")
+    if method == "minmax":
+        indices = min_max(y, points)
+    else:
+        indices = lttb(series.index.asi8.astype("float64"), y, points)
+    return series.iloc[indices]
+
+
+def _line(series, name, method="lttb", **style):
+    series = downsample(series, method=method)
+    style.setdefault("mode", "lines")
+    return go.Scatter(x=series.index, y=series.to_numpy(), name=name, **style)
+
+
+def _layout(figure, yaxis_title):
+    figure.update_layout(
+        height=320, margin=dict(l=10, r=10, t=30, b=10), hovermode="x unified", yaxis_title=yaxis_title,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, x=0),
+    )
+    return figure
+
+
+def trend_charts(frame, user_data, rule=None):
+    # Net calories, macros and water over the range in `frame` (see analytics.select_range),
+    # grouped by `rule`; each line downsampled to CHART_POINTS
+    view = resample_frame(frame, rule)
+    net = go.Figure()
+    net.add_trace(_line(view["net"], "Net", line=dict(color="#FF8E53", width=1)))
+    if rule is None:
+        net.add_trace(_line(view[f"net_{ROLLING_WINDOW}d_avg"], f"{ROLLING_WINDOW}-day average", line=dict(color="#C0392B", width=2)))
+    net.add_hline(y=user_data["daily_calorie_goal"], line_dash="dash", line_color="gray", annotation_text="Goal")
+    macros = go.Figure()
+    for column, color in MACRO_COLORS.items():
+        macros.add_trace(_line(view[column], f"{column.title()} (g)", line=dict(color=color)))
+    water = go.Figure()
+    water.add_trace(_line(view["water_ml"], "Water", "minmax", line=dict(color="#3498DB"), fill="tozeroy"))
+    water.add_hline(y=user_data["daily_water_goal"], line_dash="dash", line_color="gray", annotation_text="Goal")
+    return {
+        "Net Calories": _layout(net, "kcal"),
+        "Macros": _layout(macros, "grams"),
+        "Water": _layout(water, "ml"),
+    }
+
+
+def weight_chart(weight_log, target_weight, start=None):
+    # Logged weights from `start` ("YYYY-MM-DD", None for all), downsampled to CHART_POINTS
+    dates = sorted(date for date in weight_log if start is None or date >= start)
+    series = pd.Series([weight_log[date] for date in dates], index=pd.to_datetime(dates, format="%Y-%m-%d"), dtype="float64")
+    figure = go.Figure()
+    figure.add_trace(_line(series, "Weight", line=dict(color="#4ECDC4"), marker=dict(size=4), mode="lines+markers"))
+    if isinstance(target_weight, (int, float)):
+        figure.add_hline(y=target_weight, line_dash="dash", line_color="gray", annotation_text="Target")
+    return _layout(figure, "kg")
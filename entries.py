@@ -0,0 +1,190 @@
+from collections.abc import Mapping
+
+# Marks a document or segment whose day sections are stored as rows (see pack_document)
+DENSE_ENCODING = "dense-1"
+
+# Per-day aggregate kept in user_data["daily_totals"][date], in row order on disk
+TOTAL_FIELDS = ("calories", "protein", "carbs", "fat", "burned", "water_ml", "meal_count", "workout_count", "water_count")
+
+# "HH:MM" for every minute of the day, shared by all entries
+TIMES = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)]
+
+
+class Entry(Mapping):
+    # Fixed-field logged entry. Reads like the dict it replaces (entry["calories"],
+    # entry.get("time"), dict(entry), ==) but holds its values in slots, not a hash table.
+
+    __slots__ = ()
+    fields = ()
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class Meal(Entry):
+    __slots__ = fields = ("name", "calories", "protein", "carbs", "fat", "time")
+
+    def __init__(self, name, calories, protein, carbs, fat, time):
+        self.name = name
+        self.calories = calories
+        self.protein = protein
+        self.carbs = carbs
+        self.fat = fat
+        self.time = time
+
+
+class Workout(Entry):
+    __slots__ = fields = ("name", "calories_burned", "time")
+
+    def __init__(self, name, calories_burned, time):
+        self.name = name
+        self.calories_burned = calories_burned
+        self.time = time
+
+
+class Water(Entry):
+    __slots__ = fields = ("amount_ml", "time")
+
+    def __init__(self, amount_ml, time):
+        self.amount_ml = amount_ml
+        self.time = time
+
+
+ENTRY_TYPES = {"meals": Meal, "workouts": Workout, "water_intake": Water}
+
+
+class Interner:
+    # Per-user string table: every entry naming "Eggs (2)" shares one string object
+
+    def __init__(self):
+        self._strings = {}
+
+    def __call__(self, value):
+        return self._strings.setdefault(value, value)
+
+    def __len__(self):
+        return len(self._strings)
+
+
+def make_entry(section, entry, intern=None):
+    # Record for a dict entry; a dict with missing or extra keys is kept as it is
+    entry_type = ENTRY_TYPES[section]
+    if isinstance(entry, entry_type):
+        return entry
+    if len(entry) != len(entry_type.fields) or any(field not in entry for field in entry_type.fields):
+        return entry
+    values = [entry[field] for field in entry_type.fields]
+    if intern is not None:
+        values = [
+            intern(value) if field in ("name", "time") and isinstance(value, str) else value
+            for field, value in zip(entry_type.fields, values)
+        ]
+    return entry_type(*values)
+
+
+def compact_days(user_data, days, intern=None):
+    # Turns the dict entries of `days` ({section: iterable of dates}) into records in place
+    for section, dates in days.items():
+        if section not in ENTRY_TYPES:
+            continue
+        target = user_data.get(section, {})
+        for date in dates:
+            if target.get(date):
+                target[date] = [make_entry(section, entry, intern) for entry in target[date]]
+
+
+def to_json(value):
+    # json.dumps(default=...) hook for documents holding records
+    if isinstance(value, Entry):
+        return dict(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _minute(time):
+    hours, _, minutes = time.partition(":") if isinstance(time, str) else ("", "", "")
+    if len(hours) == 2 and len(minutes) == 2 and hours.isdigit() and minutes.isdigit() and int(hours) < 24 and int(minutes) < 60:
+        return int(hours) * 60 + int(minutes)
+    return time
+
+
+def pack_document(user_data):
+    # JSON-ready copy of user_data with entries as rows: names become indexes into a
+    # shared "names" list, times become minutes of the day, day totals plain value lists.
+    # Anything not in the usual shape (an entry with extra keys) is kept as an object.
+    dense = {key: value for key, value in user_data.items() if key not in ENTRY_TYPES and key != "daily_totals"}
+    dense["encoding"] = DENSE_ENCODING
+    names = dense["names"] = []
+    index = {}
+    for section, entry_type in ENTRY_TYPES.items():
+        if section not in user_data:
+            continue
+        named = entry_type.fields[0] == "name"
+        packed = dense[section] = {}
+        for date, entries in user_data[section].items():
+            rows = packed[date] = []
+            for entry in entries:
+                if not isinstance(entry, entry_type):
+                    entry = make_entry(section, entry)
+                    if not isinstance(entry, entry_type):
+                        rows.append(dict(entry))
+                        continue
+                row = [getattr(entry, field) for field in entry_type.fields]
+                if named:
+                    position = index.get(row[0])
+                    if position is None:
+                        position = index[row[0]] = len(names)
+                        names.append(row[0])
+                    row[0] = position
+                row[-1] = _minute(row[-1])
+                rows.append(row)
+    if "daily_totals" in user_data:
+        dense["daily_totals"] = {
+            date: [totals[field] for field in TOTAL_FIELDS] if totals.keys() == set(TOTAL_FIELDS) else totals
+            for date, totals in user_data["daily_totals"].items()
+        }
+    return dense
+
+
+def unpack_document(document, intern=None):
+    # Inverse of pack_document; a plain (pre-dense) document has its entries turned into
+    # records instead. Returns the document, changed in place.
+    if intern is None:
+        intern = Interner()
+    if document.get("encoding") != DENSE_ENCODING:
+        compact_days(document, {section: list(document.get(section, {})) for section in ENTRY_TYPES}, intern)
+        return document
+    del document["encoding"]
+    names = [intern(name) for name in document.pop("names")]
+    for section, entry_type in ENTRY_TYPES.items():
+        if section not in document:
+            continue
+        named = entry_type.fields[0] == "name"
+        for date, rows in document[section].items():
+            entries = []
+            for row in rows:
+                if isinstance(row, dict):
+                    entries.append(row)
+                    continue
+                if named:
+                    row[0] = names[row[0]]
+                time = row[-1]
+                row[-1] = TIMES[time] if isinstance(time, int) else time
+                entries.append(entry_type(*row))
+            document[section][date] = entries
+    if "daily_totals" in document:
+        document["daily_totals"] = {
+            date: dict(zip(TOTAL_FIELDS, totals)) if isinstance(totals, list) else totals
+            for date, totals in document["daily_totals"].items()
+        }
+    return document
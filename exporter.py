@@ -0,0 +1,154 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from array import array
+from datetime import date as date_type
+
+from importer import CSV_COLUMNS
+from storage import open_storage, STORAGE_BACKENDS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Rows per record batch when streaming Parquet
+PARQUET_BATCH_ROWS = 10000
+
+NUMBER_COLUMNS = ("calories", "protein", "carbs", "fat", "calories_burned", "amount_ml", "weight")
+TEXT_COLUMNS = ("type", "date", "time", "name")
+
+
+def iter_rows(user_data):
+    # One flat row per entry, day by day in date order, in the importer's column layout
+    sections = (("meal", "meals"), ("workout", "workouts"), ("water", "water_intake"))
+    dates = set(user_data["weight_log"])
+    for _, section in sections:
+        dates.update(user_data[section])
+    for date in sorted(dates):
+        for kind, section in sections:
+            for entry in user_data[section].get(date, []):
+                yield dict(entry, type=kind, date=date)
+        if date in user_data["weight_log"]:
+            yield {"type": "weight", "date": date, "weight": user_data["weight_log"][date]}
+
+
+def write_csv(user_data, f):
+    writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    for row in iter_rows(user_data):
+        writer.writerow(row)
+
+
+def write_jsonl(user_data, f):
+    for row in iter_rows(user_data):
+        f.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+
+def write_npz(user_data, f):
+    # Column arrays shared by all entry types; absent numbers are NaN, absent text is ""
+    if np is None:
+        raise RuntimeError("NumPy is required for .npz export")
+    numbers = {column: array("d") for column in NUMBER_COLUMNS}
+    texts = {column: [] for column in TEXT_COLUMNS}
+    for row in iter_rows(user_data):
+        for column in NUMBER_COLUMNS:
+            value = row.get(column)
+            numbers[column].append(float("nan") if value is None else value)
+        for column in TEXT_COLUMNS:
+            texts[column].append(row.get(column) or "")
+    columns = {column: np.frombuffer(values, dtype="float64") for column, values in numbers.items()}
+    columns["date"] = np.array(texts.pop("date"), dtype="datetime64[D]")
+    columns.update({column: np.array(values, dtype=str) for column, values in texts.items()})
+    np.savez_compressed(f, **columns)
+
+
+def write_parquet(user_data, f):
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Parquet export")
+    schema = pa.schema(
+        [(column, pa.string()) for column in ("type", "time", "name")]
+        + [("date", pa.date32())]
+        + [(column, pa.float64()) for column in NUMBER_COLUMNS]
+    )
+
+    def batch(rows):
+        return pa.RecordBatch.from_pylist(
+            [dict(row, date=date_type.fromisoformat(row["date"])) for row in rows], schema=schema
+        )
+
+    with pq.ParquetWriter(f, schema) as writer:
+        rows = []
+        for row in iter_rows(user_data):
+            rows.append(row)
+            if len(rows) >= PARQUET_BATCH_ROWS:
+                writer.write_batch(batch(rows))
+                rows = []
+        if rows:
+            writer.write_batch(batch(rows))
+
+
+# format -> (writer, binary output, file extension, MIME type)
+EXPORT_FORMATS = {
+    "csv": (write_csv, False, "csv", "text/csv"),
+    "jsonl": (write_jsonl, False, "jsonl", "application/x-ndjson"),
+    "npz": (write_npz, True, "npz", "application/octet-stream"),
+    "parquet": (write_parquet, True, "parquet", "application/vnd.apache.parquet"),
+}
+
+
+def available_formats():
+    return [fmt for fmt in EXPORT_FORMATS if (fmt != "npz" or np is not None) and (fmt != "parquet" or pa is not None)]
+
+
+def export_bytes(user_data, fmt):
+    writer, binary, _, _ = EXPORT_FORMATS[fmt]
+    buffer = io.BytesIO()
+    if binary:
+        writer(user_data, buffer)
+    else:
+        text = io.TextIOWrapper(buffer, encoding="utf-8", newline="")
+        writer(user_data, text)
+        text.flush()
+        text.detach()
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export tracker history as CSV, JSON Lines, NumPy .npz or Parquet")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("-o", "--output", default="-", help="output path, '-' for stdout (text formats only)")
+    parser.add_argument("--backend", choices=sorted(STORAGE_BACKENDS), help="storage backend (default: CALORIE_STORAGE or segments)")
+    parser.add_argument("--user", help="user id (default: CALORIE_USER or default)")
+    args = parser.parse_args()
+
+    storage = open_storage(args.backend, user=args.user)
+    user_data = storage.load()
+    if user_data is None:
+        print("No tracker data found.", file=sys.stderr)
+        sys.exit(1)
+    storage.load_history(user_data)
+
+    writer, binary, _, _ = EXPORT_FORMATS[args.format]
+    if args.output == "-":
+        if binary:
+            parser.error(f"--format {args.format} needs an --output file")
+        writer(user_data, sys.stdout)
+    elif binary:
+        with open(args.output, "wb") as f:
+            writer(user_data, f)
+    else:
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            writer(user_data, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import bisect
+import csv
+import heapq
+import json
+import os
+import re
+from array import array
+from itertools import accumulate, groupby
+
+from storage import DATA_DIR
+
+# Catalog file looked up in this order unless CALORIE_FOOD_CATALOG points elsewhere
+CATALOG_FILES = ("foods.csv", "foods.jsonl", "foods.json")
+
+NUTRIENTS = ("calories", "protein", "carbs", "fat")
+
+# A prefix term matching more distinct tokens than this is never merged across its
+# posting lists; candidates are checked against its token range instead
+MAX_PREFIX_TOKENS = 64
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def find_catalog_file(data_dir=DATA_DIR):
+    path = os.environ.get("CALORIE_FOOD_CATALOG")
+    if path:
+        return path
+    for filename in CATALOG_FILES:
+        path = os.path.join(data_dir, filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_catalog_file(path):
+    # Yields raw food dicts from CSV (header row), JSON Lines or a JSON list
+    if path.endswith(".csv"):
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+    elif path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+
+class FoodCatalog:
+    # Columnar food records plus an inverted index from name tokens to record ids.
+    # Records are stored in static rank order (short, generic names first), so every
+    # posting list is already sorted best-first and a query can stop after `limit` hits.
+
+    def __init__(self, foods):
+        rows = []
+        for food in foods:
+            name = str(food.get("name", "")).strip()
+            if not name:
+                continue
+            try:
+                values = tuple(float(food.get(nutrient) or 0) for nutrient in NUTRIENTS)
+            except (TypeError, ValueError):
+                continue
+            rows.append((len(name), name.lower(), name, food.get("category") or "", values))
+        rows.sort()
+
+        self.names = [row[2] for row in rows]
+        self.categories = [row[3] for row in rows]
+        self.nutrients = {nutrient: array("d", (row[4][i] for row in rows)) for i, nutrient in enumerate(NUTRIENTS)}
+
+        # Token ids are in sorted token order, so a prefix term is one contiguous id range;
+        # each record keeps its sorted token ids for checking candidates without re-tokenizing
+        words = [set(tokenize(name)) for name in self.names]
+        self.tokens = sorted(set().union(*words))
+        token_ids = {token: token_id for token_id, token in enumerate(self.tokens)}
+        self.postings = [array("I") for _ in self.tokens]
+        self.record_tokens = array("I")
+        self.token_offsets = array("I", [0])
+        for record_id, record_words in enumerate(words):
+            ids = sorted(token_ids[word] for word in record_words)
+            self.record_tokens.extend(ids)
+            self.token_offsets.append(len(self.record_tokens))
+            for token_id in ids:
+                self.postings[token_id].append(record_id)
+        self.cumulative = [0] + list(accumulate(len(ids) for ids in self.postings))
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(read_catalog_file(path))
+
+    @classmethod
+    def from_categories(cls, foods_by_category):
+        return cls(dict(food, category=category) for category, foods in foods_by_category.items() for food in foods)
+
+    def record(self, record_id):
+        food = {"name": self.names[record_id], "category": self.categories[record_id]}
+        for nutrient in NUTRIENTS:
+            value = self.nutrients[nutrient][record_id]
+            food[nutrient] = int(value) if value.is_integer() else value
+        return food
+
+    def _token_range(self, term):
+        low = bisect.bisect_left(self.tokens, term)
+        high = bisect.bisect_left(self.tokens, term + "\uffff", low)
+        return low, high
+
+    def _has_token(self, record_id, low, high):
+        # Whether the record has a token with id in [low, high)
+        start, end = self.token_offsets[record_id], self.token_offsets[record_id + 1]
+        position = bisect.bisect_left(self.record_tokens, low, start, end)
+        return position < end and self.record_tokens[position] < high
+
+    def _in_all(self, record_id, lists, cursors):
+        # Whether record_id is in every sorted list; candidates come in increasing order,
+        # so each list's cursor only moves forward
+        for i, ids in enumerate(lists):
+            cursors[i] = bisect.bisect_left(ids, record_id, cursors[i])
+            if cursors[i] == len(ids) or ids[cursors[i]] != record_id:
+                return False
+        return True
+
+    def _candidates(self, low, high, size, wanted):
+        # Record ids matching one term, in rank order. A wide prefix is served by walking
+        # records in rank order when that is expected to find `wanted` hits sooner than
+        # merging its posting lists takes to start.
+        if high - low == 1:
+            return iter(self.postings[low])
+        if high - low > MAX_PREFIX_TOKENS and wanted * len(self) / size < high - low:
+            return (record_id for record_id in range(len(self)) if self._has_token(record_id, low, high))
+        merged = heapq.merge(*self.postings[low:high])
+        return (record_id for record_id, _ in groupby(merged))
+
+    def search(self, query, limit=20):
+        # Every query term must prefix-match some word of the name; results are
+        # ranked by whole-name prefix match first, then by static rank
+        terms = tokenize(query)
+        if not terms:
+            return []
+        ranges = [self._token_range(term) for term in terms]
+        sizes = [self.cumulative[high] - self.cumulative[low] for low, high in ranges]
+        if min(sizes) == 0:
+            return []
+
+        # Intersect starting from the shortest term. Exact tokens are intersected as whole
+        # sorted posting lists; prefix terms are checked per candidate against the
+        # candidate's token ids. Stops once enough matches are found in rank order.
+        order = sorted(range(len(terms)), key=sizes.__getitem__)
+        exact = [self.postings[ranges[i][0]] for i in order if ranges[i][1] - ranges[i][0] == 1]
+        prefixes = [ranges[i] for i in order if ranges[i][1] - ranges[i][0] > 1]
+        wanted = limit * 5
+        if exact and len(exact[0]) == sizes[order[0]]:
+            if len(exact) == 1:
+                candidates = iter(exact[0])
+            else:
+                common = set(exact[0])
+                for ids in exact[1:]:
+                    common.intersection_update(ids)
+                candidates = iter(sorted(common))
+        else:
+            low, high = prefixes.pop(0)
+            candidates = self._candidates(low, high, sizes[order[0]], wanted)
+            cursors = [0] * len(exact)
+            candidates = (record_id for record_id in candidates if self._in_all(record_id, exact, cursors))
+        matches = []
+        for record_id in candidates:
+            if all(self._has_token(record_id, low, high) for low, high in prefixes):
+                matches.append(record_id)
+                if len(matches) >= wanted:
+                    break
+
+        needle = query.strip().lower()
+        matches.sort(key=lambda record_id: (not self.names[record_id].lower().startswith(needle), record_id))
+        return [self.record(record_id) for record_id in matches[:limit]]
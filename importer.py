@@ -0,0 +1,154 @@
+import argparse
+import csv
+import json
+import math
+from datetime import date as date_type
+
+import achievements
+from entries import make_entry
+from storage import open_storage, STORAGE_BACKENDS
+from tracker import (
+    EXPERIENCE, add_meal_totals, add_water_totals, add_workout_totals, backfill_streaks, ensure_daily_totals,
+    grant_experience, new_user_data, save_merging,
+)
+
+# CSV header understood by the importer; unused columns may be left empty per row
+CSV_COLUMNS = ("type", "date", "time", "name", "calories", "protein", "carbs", "fat", "calories_burned", "amount_ml", "weight")
+
+# Required numeric fields per event type
+NUMBER_FIELDS = {
+    "meal": ("calories", "protein", "carbs", "fat"),
+    "workout": ("calories_burned",),
+    "water": ("amount_ml",),
+    "weight": ("weight",),
+}
+
+SECTIONS = {"meal": "meals", "workout": "workouts", "water": "water_intake"}
+COUNTERS = {"meal": "total_meals_logged", "workout": "total_workouts", "water": "total_water_logged"}
+
+
+def read_rows(lines, fmt):
+    # Streams raw rows from CSV (with header) or JSON Lines, numbered from 1
+    if fmt == "csv":
+        for line_no, row in enumerate(csv.DictReader(lines), 2):
+            yield line_no, row
+    else:
+        for line_no, line in enumerate(lines, 1):
+            if line.strip():
+                try:
+                    yield line_no, json.loads(line)
+                except ValueError:
+                    yield line_no, line
+
+
+def _number(value, field):
+    if value is None or value == "":
+        raise ValueError(f"missing {field}")
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{field} must be a finite number")
+    if number < 0:
+        raise ValueError(f"{field} must not be negative")
+    return int(number) if number.is_integer() else number
+
+
+def validate_row(row):
+    # Returns (kind, date, entry) for one raw row or raises ValueError
+    if not isinstance(row, dict):
+        raise ValueError("not a JSON object")
+    kind = str(row.get("type", "")).strip().lower()
+    if kind not in NUMBER_FIELDS:
+        raise ValueError(f"unknown type {row.get('type')!r}")
+    # Stored as YYYY-MM-DD whatever ISO form it came in ("20240101", "2024-W01-1"): day
+    # keys are compared and split into months as strings
+    date = date_type.fromisoformat(str(row.get("date", "")).strip()).isoformat()
+    if kind == "weight":
+        return kind, date, _number(row.get("weight"), "weight")
+
+    time = str(row.get("time") or "00:00").strip()
+    hours, _, minutes = time.partition(":")
+    if not (hours.isdigit() and minutes.isdigit() and int(hours) < 24 and int(minutes) < 60):
+        raise ValueError(f"bad time {time!r}")
+    entry = {}
+    if kind in ("meal", "workout"):
+        name = str(row.get("name") or "").strip()
+        if not name:
+            raise ValueError("missing name")
+        entry["name"] = name
+    for field in NUMBER_FIELDS[kind]:
+        entry[field] = _number(row.get(field), field)
+    entry["time"] = f"{int(hours):02d}:{int(minutes):02d}"
+    return kind, date, entry
+
+
+def import_rows(user_data, rows):
+    # Applies validated rows straight into the per-date structures. XP, streaks and
+    # achievements are settled once at the end instead of per entry.
+    summary = {"meal": 0, "workout": 0, "water": 0, "weight": 0, "errors": []}
+    touched = set()
+    experience = 0
+    for line_no, row in rows:
+        try:
+            kind, date, entry = validate_row(row)
+        except (ValueError, TypeError) as e:
+            summary["errors"].append((line_no, str(e)))
+            continue
+        summary[kind] += 1
+        experience += EXPERIENCE[kind]
+        if kind == "weight":
+            user_data["weight_log"][date] = entry
+            continue
+        entry = make_entry(SECTIONS[kind], entry)
+        user_data[SECTIONS[kind]].setdefault(date, []).append(entry)
+        user_data[COUNTERS[kind]] += 1
+        touched.add((SECTIONS[kind], date))
+        if kind == "meal":
+            add_meal_totals(user_data, date, entry)
+        elif kind == "workout":
+            add_workout_totals(user_data, date, entry)
+        else:
+            add_water_totals(user_data, date, entry)
+
+    for section, date in touched:
+        user_data[section][date].sort(key=lambda entry: entry["time"])
+    if summary["weight"]:
+        user_data["current_weight"] = user_data["weight_log"][max(user_data["weight_log"])]
+    grant_experience(user_data, experience)
+    backfill_streaks(user_data)
+    achievements.replay(user_data, date_type.today().isoformat())
+    return summary
+
+
+def import_file(user_data, path):
+    fmt = "csv" if path.endswith(".csv") else "jsonl"
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        return import_rows(user_data, read_rows(f, fmt))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import meals, workouts, water and weights from CSV or JSON Lines")
+    parser.add_argument("path", help=".csv with columns " + ",".join(CSV_COLUMNS) + " or .jsonl with the same keys")
+    parser.add_argument("--backend", choices=sorted(STORAGE_BACKENDS), help="storage backend (default: CALORIE_STORAGE or segments)")
+    parser.add_argument("--user", help="user id (default: CALORIE_USER or default)")
+    parser.add_argument("--dry-run", action="store_true", help="validate and report without saving")
+    args = parser.parse_args()
+
+    storage = open_storage(args.backend, user=args.user)
+    user_data = storage.load() or new_user_data()
+    storage.load_history(user_data)
+    ensure_daily_totals(user_data)
+
+    summary = import_file(user_data, args.path)
+    for line_no, error in summary["errors"][:20]:
+        print(f"line {line_no}: {error}")
+    print(
+        f"imported {summary['meal']} meals, {summary['workout']} workouts, {summary['water']} water entries, "
+        f"{summary['weight']} weights; {len(summary['errors'])} rows rejected"
+    )
+    print(f"level {user_data['level']} ({user_data['experience']}/{user_data['exp_needed']} XP), rank {user_data['rank']}")
+    if not args.dry_run:
+        save_merging(storage, user_data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from urllib.parse import unquote, urlsplit
+
+import achievements
+import metrics
+from importer import validate_row
+from storage import STORAGE_BACKENDS, open_storage
+from tracker import Tracker, backfill_streaks, ensure_daily_totals, ensure_streaks, new_user_data, refresh_merging, save_merging
+
+# Largest request body accepted, and most events in one request
+MAX_BODY_BYTES = 4 * 1024 * 1024
+MAX_EVENTS = 10000
+
+# Idle keep-alive connections are closed after this long
+KEEPALIVE_SECONDS = 60
+
+STATUS_TEXT = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class UserWriter:
+    # Applies one user's posted events and saves them. Events posted while a save is in
+    # flight wait and go out together in the next one, so a burst costs one write however
+    # many requests it came in. The document is kept between batches and brought up to
+    # date with what the UI saved before each one.
+
+    def __init__(self, storage, clock=datetime.now):
+        self.storage = storage
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.user_data = None
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        self.batches = 0
+        self.events = 0
+
+    def post(self, events):
+        # Returns a future resolved with the revision the events were saved at
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((events, future))
+        self._wakeup.set()
+        return future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            if not batch:
+                continue
+            try:
+                revision = await asyncio.to_thread(self._apply, [event for events, _ in batch for event in events])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(revision)
+
+    def _load(self):
+        if self.user_data is None:
+            user_data = self.storage.load() or new_user_data()
+            if "daily_totals" not in user_data or "streak_last_date" not in user_data or achievements.needs_replay(user_data):
+                # Backfills below derive from all of history, as in the app
+                self.storage.load_history(user_data)
+            ensure_daily_totals(user_data)
+            ensure_streaks(user_data)
+            achievements.ensure_achievements(user_data, self.clock().date().isoformat())
+            self.user_data = user_data
+        else:
+            refresh_merging(self.storage, self.user_data, lock=self.lock)
+        return self.user_data
+
+    def _apply(self, events):
+        # Runs on a worker thread: the same Tracker rules as the UI, one save for all events
+        user_data = self._load()
+        events.sort(key=lambda event: (event[1], event[2]["time"] if isinstance(event[2], dict) else ""))
+        latest = max(user_data["daily_totals"], default=None)
+        earliest = events[0][1]
+        clock = EventClock()
+        tracker = Tracker(user_data, clock=clock, intern=self.storage.names)
+        changed = set()
+        with self.lock:
+            # Cold months must be in the document before their days are edited
+            self.storage.load_history(user_data, earliest)
+            for kind, date, entry in events:
+                if kind == "weight":
+                    clock.now = datetime.fromisoformat(date)
+                    days, _ = tracker.log_weight(entry)
+                else:
+                    clock.now = datetime.fromisoformat(f"{date}T{entry['time']}")
+                    if kind == "meal":
+                        days, _ = tracker.log_meal(entry["name"], entry["calories"], entry["protein"], entry["carbs"], entry["fat"])
+                    elif kind == "workout":
+                        days, _ = tracker.log_workout(entry["name"], entry["calories_burned"])
+                    else:
+                        days, _ = tracker.log_water(entry["amount_ml"])
+                changed.update(days)
+            if user_data["weight_log"] and any(kind == "weight" for kind, _, _ in events):
+                user_data["current_weight"] = user_data["weight_log"][max(user_data["weight_log"])]
+            if latest is not None and earliest < latest:
+                # Entries before the latest logged day: streaks and achievements are
+                # re-derived from the whole history, as the importer does
+                self.storage.load_history(user_data)
+                backfill_streaks(user_data)
+                achievements.replay(user_data, self.clock().date().isoformat())
+        save_merging(self.storage, user_data, sorted(changed), lock=self.lock)
+        self.batches += 1
+        self.events += len(events)
+        return user_data["revision"]
+
+
+class EventClock:
+    # Tracker clock set to each event's own time before it is logged
+
+    def __init__(self):
+        self.now = None
+
+    def __call__(self):
+        return self.now
+
+
+class IngestServer:
+    # HTTP/1.1 JSON API over asyncio streams:
+    #   POST /users/<user>/events  {"events": [...]} or a bare list; each event has the
+    #        importer's keys ("type", "name", "calories", ...), with "date" and "time"
+    #        defaulting to now. Answers once the events are saved, or at once with 202
+    #        when ?wait=0.
+    #   GET  /health
+    #   GET  /metrics  Prometheus text format
+
+    def __init__(self, backend=None, clock=datetime.now):
+        self.backend = backend
+        self.clock = clock
+        self.writers = {}
+        self.requests = 0
+        self.started = time.monotonic()
+
+    def writer(self, user):
+        if user not in self.writers:
+            self.writers[user] = UserWriter(metrics.watch_storage(open_storage(self.backend, user=user)), self.clock)
+        return self.writers[user]
+
+    def validate(self, payload):
+        events = payload.get("events") if isinstance(payload, dict) else payload
+        if not isinstance(events, list):
+            raise HttpError(400, "expected a list of events or {\"events\": [...]}")
+        if len(events) > MAX_EVENTS:
+            raise HttpError(413, f"at most {MAX_EVENTS} events per request")
+        now = self.clock()
+        valid, rejected = [], []
+        for index, event in enumerate(events):
+            if isinstance(event, dict):
+                event = {"date": now.date().isoformat(), "time": now.strftime("%H:%M"), **event}
+            try:
+                valid.append(validate_row(event))
+            except (ValueError, TypeError) as e:
+                rejected.append({"index": index, "error": str(e)})
+        return valid, rejected
+
+    async def handle_events(self, user, body, query):
+        if not user:
+            raise HttpError(404, "missing user id")
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise HttpError(400, "body is not valid JSON")
+        valid, rejected = self.validate(payload)
+        result = {"accepted": len(valid), "rejected": rejected}
+        if not valid:
+            return 200, result
+        future = self.writer(user).post(valid)
+        if query.get("wait") == "0":
+            return 202, result
+        result["revision"] = await future
+        return 200, result
+
+    def health(self):
+        return 200, {
+            "status": "ok",
+            "uptime_s": round(time.monotonic() - self.started, 1),
+            "requests": self.requests,
+            "users": len(self.writers),
+            "batches": sum(writer.batches for writer in self.writers.values()),
+            "events": sum(writer.events for writer in self.writers.values()),
+        }
+
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        query = dict(part.split("=", 1) for part in url.query.split("&") if "=" in part)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        if parts == ["metrics"]:
+            if method != "GET":
+                raise HttpError(405, "use GET")
+            return 200, metrics.REGISTRY.render()
+        if parts == ["health"]:
+            if method != "GET":
+                raise HttpError(405, "use GET")
+            return self.health()
+        if len(parts) == 3 and parts[0] == "users" and parts[2] == "events":
+            if method != "POST":
+                raise HttpError(405, "use POST")
+            return await self.handle_events(parts[1], body, query)
+        raise HttpError(404, f"no route for {url.path}")
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                self.requests += 1
+                try:
+                    if length > MAX_BODY_BYTES:
+                        raise HttpError(413, f"body larger than {MAX_BODY_BYTES} bytes")
+                    body = await reader.readexactly(length) if length else b""
+                    status, result = await self.route(method, target, body)
+                except HttpError as e:
+                    status, result = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, result = 500, {"error": repr(e)}
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close" and status != 413
+                if isinstance(result, str):
+                    payload, content_type = result.encode(), metrics.CONTENT_TYPE
+                else:
+                    payload, content_type = json.dumps(result).encode(), "application/json"
+                writer.write(
+                    f"{version} {status} {STATUS_TEXT[status]}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, backend=None):
+    server = IngestServer(backend)
+    listener = await asyncio.start_server(server.serve_connection, host, port)
+    print(f"ingesting on http://{host}:{port}/users/<user>/events")
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for logging meals, workouts, water and weights")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--backend", choices=sorted(STORAGE_BACKENDS), help="storage backend (default: CALORIE_STORAGE or segments)")
+    args = parser.parse_args()
+    # Run from the app's directory: the data is read and written where the UI keeps it
+    try:
+        asyncio.run(serve(args.host, args.port, args.backend))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from urllib.parse import urlencode
+
+from autosave import AUTOSAVE_WINDOW_MS
+from bench import synthetic_user
+from storage import DEFAULT_USER, open_storage
+from tracker import save_merging
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Relative weights of what a simulated user does next. Log actions first switch to their
+# page when the session is elsewhere; that navigation is timed as its own rerun.
+ACTION_MIX = {
+    "view home": 20,
+    "view analytics": 8,
+    "view weight": 4,
+    "view achievements": 4,
+    "log water": 30,
+    "log meal": 24,
+    "log workout": 10,
+}
+
+VIEW_PAGES = {
+    "view home": "🏠 Home",
+    "view analytics": "📊 Analytics",
+    "view weight": "⚖️ Weight",
+    "view achievements": "🏆 Achievements",
+}
+
+LOG_PAGES = {"log water": "💧 Log Water", "log meal": "🍽️ Log Meal", "log workout": "🏋️ Log Workout"}
+
+# Button each log action clicks: a widget key, or for the water buttons their labels
+LOG_BUTTONS = {"log meal": ["log_quick"], "log workout": ["log_quick_workout"], "log water": ["💧 200ml", "💧 250ml", "💧 300ml", "💧 500ml", "💧 1L"]}
+
+SERVER_START_SECONDS = 60
+RERUN_TIMEOUT_SECONDS = 120
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_stats(samples):
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(_percentile(ordered, 0.50), 2),
+        "p95_ms": round(_percentile(ordered, 0.95), 2),
+        "p99_ms": round(_percentile(ordered, 0.99), 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+def process_usage(pid):
+    # (CPU seconds, RSS in MB) of a process from /proc; (None, None) where there is no /proc
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None, None
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / ticks
+    return cpu_seconds, pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir):
+    # `streamlit run app.py` on a free local port, with its data under `workdir`
+    port = _free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", APP_PATH,
+            "--server.headless", "true", "--server.address", "127.0.0.1", "--server.port", str(port),
+            "--browser.gatherUsageStats", "false", "--server.fileWatcherType", "none",
+        ],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + SERVER_START_SECONDS
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"streamlit exited with status {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return server, port
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"streamlit did not answer on port {port} within {SERVER_START_SECONDS}s")
+
+
+class Client:
+    # One simulated browser tab on the Streamlit websocket protocol. It keeps what the
+    # frontend would: the navigation radio's value, and the widgets of the last run with
+    # the fragment each belongs to, so a button click reruns just that fragment.
+
+    def __init__(self, port, user, rng, think_ms):
+        self.port = port
+        self.query_string = urlencode({"user": user}) if user != DEFAULT_USER else ""
+        self.rng = rng
+        self.think_ms = think_ms
+        self.page = "🏠 Home"
+        self.nav_id = None
+        self.widgets = {}
+        self.samples = []
+        self.errors = []
+        self.ws = None
+
+    async def _rerun(self, kind, trigger=None):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        state = message.rerun_script
+        state.query_string = self.query_string
+        if self.nav_id is not None:
+            radio = state.widget_states.widgets.add()
+            radio.id = self.nav_id
+            radio.string_value = self.page
+        if trigger is not None:
+            widget_id, fragment_id = trigger
+            button = state.widget_states.widgets.add()
+            button.id = widget_id
+            button.trigger_value = True
+            if fragment_id:
+                state.fragment_id = fragment_id
+        else:
+            self.widgets = {}
+        start = time.perf_counter()
+        await self.ws.send(message.SerializeToString())
+        while True:
+            reply = ForwardMsg()
+            reply.ParseFromString(await asyncio.wait_for(self.ws.recv(), RERUN_TIMEOUT_SECONDS))
+            kind_of = reply.WhichOneof("type")
+            if kind_of == "delta":
+                self._element(reply.delta)
+            elif kind_of == "script_finished":
+                if reply.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                break
+        self.samples.append((kind, (time.perf_counter() - start) * 1000))
+
+    def _element(self, delta):
+        element = delta.new_element
+        element_type = element.WhichOneof("type")
+        if element_type == "exception":
+            self.errors.append(f"{element.exception.type}: {element.exception.message}")
+        elif element_type == "radio" and element.radio.label == "Navigation":
+            self.nav_id = element.radio.id
+        elif element_type == "button":
+            button = element.button
+            self.widgets[button.label] = (button.id, delta.fragment_id)
+            # Keyed widget ids end with their key
+            self.widgets[button.id.rsplit("-", 1)[-1]] = (button.id, delta.fragment_id)
+
+    async def _navigate(self, page):
+        self.page = page
+        await self._rerun("navigate")
+
+    async def step(self, action):
+        if action in VIEW_PAGES:
+            await self._navigate(VIEW_PAGES[action])
+            return
+        if self.page != LOG_PAGES[action]:
+            await self._navigate(LOG_PAGES[action])
+        trigger = self.widgets.get(self.rng.choice(LOG_BUTTONS[action]))
+        if trigger is None:
+            self.errors.append(f"{action}: button not on {self.page}")
+            await self._navigate(self.page)
+            return
+        await self._rerun(action, trigger)
+
+    async def run(self, deadline):
+        import websockets
+
+        actions, weights = zip(*ACTION_MIX.items())
+        url = f"ws://127.0.0.1:{self.port}/_stcore/stream"
+        try:
+            async with websockets.connect(
+                url, subprotocols=["streamlit"], origin=f"http://127.0.0.1:{self.port}", max_size=None,
+            ) as self.ws:
+                await self._rerun("start")
+                while time.monotonic() < deadline:
+                    await self.step(self.rng.choices(actions, weights)[0])
+                    if self.think_ms:
+                        await asyncio.sleep(self.rng.expovariate(1000 / self.think_ms))
+        except Exception as e:
+            self.errors.append(f"aborted: {e!r}")
+
+
+def seed_users(workdir, users, history_years, seed):
+    # Gives every simulated user `history_years` of synthetic history before the run
+    if not history_years:
+        return
+    history = json.dumps(synthetic_user(history_years, seed), default=dict)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for user in users:
+            save_merging(open_storage(user=user), json.loads(history), force=True)
+    finally:
+        os.chdir(cwd)
+
+
+async def _drive(clients, duration):
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(client.run(deadline) for client in clients))
+
+
+def run_load(workdir, sessions, duration, history_years=0, separate_users=False, think_ms=0, seed=0):
+    # One fresh server per run, so runs with different session counts do not share caches
+    users = [f"load-{i}" for i in range(sessions)] if separate_users else [DEFAULT_USER]
+    seed_users(workdir, users, history_years, seed)
+    server, port = start_server(workdir)
+    try:
+        rng = random.Random(seed)
+        clients = [Client(port, users[i % len(users)], random.Random(rng.random()), think_ms) for i in range(sessions)]
+        idle_cpu, idle_rss = process_usage(server.pid)
+        wall_start = time.monotonic()
+        asyncio.run(_drive(clients, duration))
+        wall = time.monotonic() - wall_start
+        cpu, rss = process_usage(server.pid)
+        # Let the app's write-behind queues drain before the server goes away
+        time.sleep(2 * AUTOSAVE_WINDOW_MS / 1000 + 0.5)
+    finally:
+        server.terminate()
+        server.wait()
+
+    by_kind = {}
+    for client in clients:
+        for kind, ms in client.samples:
+            by_kind.setdefault(kind, []).append(ms)
+    reruns = [ms for client in clients for kind, ms in client.samples if kind != "start"]
+    errors = [error for client in clients for error in client.errors]
+    cpu_seconds = cpu - idle_cpu if cpu is not None else None
+    return {
+        "sessions": sessions,
+        "users": len(users),
+        "history_years": history_years,
+        "think_ms": think_ms,
+        "wall_seconds": round(wall, 2),
+        "reruns": len(reruns),
+        "throughput_per_s": round(len(reruns) / wall, 2) if wall else 0.0,
+        "latency": {
+            "all": latency_stats(reruns) if reruns else None,
+            **{kind: latency_stats(samples) for kind, samples in sorted(by_kind.items())},
+        },
+        "server_cpu_seconds": round(cpu_seconds, 2) if cpu_seconds is not None else None,
+        "server_cpu_percent": round(100 * cpu_seconds / wall, 1) if cpu_seconds is not None and wall else None,
+        "server_rss_mb_idle": round(idle_rss, 1) if idle_rss is not None else None,
+        "server_rss_mb": round(rss, 1) if rss is not None else None,
+        "errors": len(errors),
+        "error_samples": errors[:10],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive a local app.py server with concurrent simulated sessions and report rerun latency")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16], help="concurrent sessions; one run per value (default: 1 4 16)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds each run lasts")
+    parser.add_argument("--history-years", type=int, default=0, help="synthetic history each user starts with")
+    parser.add_argument("--separate-users", action="store_true", help="one profile per session instead of all sharing one")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a session's actions (0 for back-to-back)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="where each run keeps the app's data (default: a new temporary directory)")
+    parser.add_argument("--output", default="loadtest_results.json", help="where to write the results JSON")
+    args = parser.parse_args()
+
+    try:
+        import websockets  # noqa: F401
+    except ImportError:
+        parser.error("the load test needs the websockets package (pip install websockets)")
+
+    base = os.path.abspath(args.data_dir) if args.data_dir else tempfile.mkdtemp(prefix="calorie-load-")
+    runs = []
+    for sessions in args.sessions:
+        workdir = os.path.join(base, f"sessions-{sessions}")
+        os.makedirs(workdir, exist_ok=True)
+        result = run_load(workdir, sessions, args.duration, args.history_years, args.separate_users, args.think_ms, args.seed)
+        runs.append(result)
+        overall = result["latency"]["all"] or {}
+        print(
+            f"{sessions:>3} sessions: {result['reruns']} reruns, {result['throughput_per_s']}/s, "
+            f"p50 {overall.get('p50_ms')} p95 {overall.get('p95_ms')} p99 {overall.get('p99_ms')} ms, "
+            f"server cpu {result['server_cpu_percent']}%, rss {result['server_rss_mb']} MB, {result['errors']} errors"
+        )
+    with open(args.output, "w") as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "duration": args.duration,
+            "runs": runs,
+        }, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
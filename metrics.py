@@ -0,0 +1,317 @@
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Port for the Prometheus endpoint started by the app; unset leaves it off
+METRICS_PORT = os.environ.get("CALORIE_METRICS_PORT")
+METRICS_HOST = os.environ.get("CALORIE_METRICS_HOST", "127.0.0.1")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# A session counts as active while it reran within this many seconds
+ACTIVE_SESSION_SECONDS = 300
+
+# Bucket upper bounds for latencies (seconds) and sizes (bytes)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Registry:
+    # Every metric of the process, rendered together in registration order
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            samples = metric.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._children = {}
+        registry.register(self)
+
+    def labels(self, *values):
+        # The child for one set of label values; keep it to skip the lookup on hot paths
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _pairs(self, values):
+        return list(zip(self.label_names, values))
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self, lock):
+        self.value = 0
+        self.lock = lock
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._pairs(values), child.value) for values, child in self._children.items()]
+
+
+class Gauge(Metric):
+    # Set directly, or computed at scrape time by `callback`, which returns a number or
+    # {label values tuple: number}
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None, registry=REGISTRY):
+        self.callback = callback
+        super().__init__(name, help, labels, registry)
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def samples(self):
+        if self.callback is None:
+            with self._lock:
+                return [(self.name, self._pairs(values), child.value) for values, child in self._children.items()]
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, self._pairs(labels), value) for labels, value in values.items() if value is not None]
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds, lock):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.lock = lock
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(Metric):
+    # Fixed buckets: observe() is a bisect plus two additions
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels, registry)
+
+    def _new_child(self):
+        return _Buckets(self.buckets, self._lock)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            children = [(values, list(child.counts), child.sum) for values, child in self._children.items()]
+        for values, counts, total in children:
+            pairs = self._pairs(values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", pairs + [("le", _number(float(bound)))], cumulative))
+            samples.append((f"{self.name}_sum", pairs, total))
+            samples.append((f"{self.name}_count", pairs, cumulative))
+        return samples
+
+
+# Storage: every save goes through tracker.save_merging, every write through a backend commit
+SAVES = Counter("calorie_storage_saves_total", "Saves written, by mode (full snapshot or changed days)", ("mode",))
+SAVE_SECONDS = Histogram("calorie_storage_save_seconds", "Time to save a document, merges and retries included")
+SAVE_CONFLICTS = Counter("calorie_storage_save_conflicts_total", "Saves that found a newer revision and merged it in")
+SAVE_FAILURES = Counter("calorie_storage_save_failures_total", "Saves that raised")
+WRITE_BYTES = Histogram("calorie_storage_write_bytes", "Bytes written per committed save", buckets=BYTES_BUCKETS)
+
+# App calls timed with perf.timed (save_data, load_data, flush_data, load_history, ...)
+CALL_SECONDS = Histogram("calorie_call_seconds", "Latency of instrumented app calls", ("call",))
+
+LOG_EVENTS = Counter("calorie_log_events_total", "Entries logged through the tracker, by type", ("type",))
+
+RERUN_SECONDS = Histogram("calorie_rerun_seconds", "Streamlit rerun duration, fragment reruns included")
+RERUNS = Counter("calorie_reruns_total", "Streamlit reruns, by whether st.rerun cut them short", ("interrupted",))
+
+# Cache lookups by cache name (documents, each cached view); misses counted where the value is built
+CACHE_LOOKUPS = Counter("calorie_cache_lookups_total", "Cache lookups", ("cache",))
+CACHE_MISSES = Counter("calorie_cache_misses_total", "Cache lookups that had to build or load the value", ("cache",))
+
+
+def _hit_ratios():
+    ratios = {}
+    for values, lookups in list(CACHE_LOOKUPS._children.items()):
+        if lookups.value:
+            ratios[values] = round(1 - CACHE_MISSES.labels(*values).value / lookups.value, 4)
+    return ratios
+
+
+Gauge("calorie_cache_hit_ratio", "Share of cache lookups served from the cache", ("cache",), callback=_hit_ratios)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def session_seen(session_id):
+    with _sessions_lock:
+        _sessions[session_id] = time.monotonic()
+
+
+def _active_sessions():
+    cutoff = time.monotonic() - ACTIVE_SESSION_SECONDS
+    with _sessions_lock:
+        for session_id in [session_id for session_id, seen in _sessions.items() if seen < cutoff]:
+            del _sessions[session_id]
+        return len(_sessions)
+
+
+Gauge("calorie_active_sessions", f"Browser sessions that reran in the last {ACTIVE_SESSION_SECONDS} s", callback=_active_sessions)
+
+_storages = weakref.WeakSet()
+
+
+def watch_storage(storage):
+    # Reports the storage's file sizes under calorie_tracker_file_bytes
+    _storages.add(storage)
+    return storage
+
+
+def _file_sizes():
+    sizes = {}
+    for storage in list(_storages):
+        paths = list(storage.files())
+        months_dir = getattr(storage, "months_dir", None)
+        if months_dir and os.path.isdir(months_dir):
+            paths += [os.path.join(months_dir, name) for name in os.listdir(months_dir)]
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            name = os.path.relpath(path, storage.data_dir)
+            sizes[(storage.user, name)] = size
+    return sizes
+
+
+Gauge("calorie_tracker_file_bytes", "Size of each file backing a user's document", ("user", "file"), callback=_file_sizes)
+
+
+def _autosave_stats():
+    from autosave import _queues
+
+    depth = {}
+    for queue in list(_queues):
+        stats = queue.stats()
+        depth[(queue.storage.user,)] = stats["queue_depth"]
+    return depth
+
+
+Gauge("calorie_autosave_queue_depth", "Changes waiting in a user's write-behind queue", ("user",), callback=_autosave_stats)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def start_server(port, host=METRICS_HOST):
+    # Serves /metrics on a daemon thread; one server per port however often it is called
+    port = int(port)
+    with _servers_lock:
+        if port not in _servers:
+            server = ThreadingHTTPServer((host, port), _Handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+            _servers[port] = server
+        return _servers[port]
@@ -0,0 +1,163 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+from entries import to_json
+from storage import DATA_DIR
+
+# Instrumentation log, written while the debug panel or CALORIE_PERF=1 is on
+LOG_PATH = os.environ.get("CALORIE_PERF_LOG", os.path.join(DATA_DIR, "perf.jsonl"))
+LOG_ALWAYS = os.environ.get("CALORIE_PERF") == "1"
+
+# Reruns kept for the rolling histogram, process-wide
+HISTORY = 500
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is open-ended
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_local = threading.local()
+_lock = threading.Lock()
+_recent = deque(maxlen=HISTORY)
+
+
+def start_rerun():
+    # Streamlit runs each session's script on its own thread, so the open rerun is
+    # thread-local. A rerun cut short by st.rerun() is kept and flagged as interrupted.
+    previous = getattr(_local, "rerun", None)
+    if previous is not None:
+        # It is only known to have lasted until its last lap
+        _finish(previous, previous["lap"], interrupted=True)
+    now = time.perf_counter()
+    _local.rerun = {"ts": time.time(), "start": now, "lap": now, "sections": {}, "calls": {}}
+
+
+def lap(name):
+    # Time since the previous lap (or rerun start) is booked under `name`
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        return
+    now = time.perf_counter()
+    rerun["sections"][name] = rerun["sections"].get(name, 0) + (now - rerun["lap"]) * 1000
+    rerun["lap"] = now
+
+
+@contextmanager
+def timed(name):
+    # Times a call (e.g. save_data) inside the current section; counts repeat calls.
+    # The latency also goes to calorie_call_seconds, rerun or not.
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.CALL_SECONDS.labels(name).observe(elapsed)
+        rerun = getattr(_local, "rerun", None)
+        if rerun is not None:
+            elapsed *= 1000
+            count, total = rerun["calls"].get(name, (0, 0))
+            rerun["calls"][name] = (count + 1, total + elapsed)
+
+
+def fragment(name):
+    # Decorator for st.fragment bodies. A fragment rerun on its own is recorded as a rerun
+    # with one section; within a full rerun its time is part of the enclosing section.
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "rerun", None) is not None:
+                return func(*args, **kwargs)
+            start_rerun()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                lap(f"fragment {name}")
+                end_rerun()
+        return wrapper
+    return decorate
+
+
+def end_rerun(user_data=None, log=False):
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        return None
+    end = time.perf_counter()
+    # Serializing the document is costly, so its size is only measured while logging
+    size = len(json.dumps(user_data, separators=(",", ":"), default=to_json)) if log and user_data is not None else None
+    return _finish(rerun, end, user_data_bytes=size, log=log or LOG_ALWAYS)
+
+
+def _finish(rerun, end, interrupted=False, user_data_bytes=None, log=LOG_ALWAYS):
+    _local.rerun = None
+    metrics.RERUNS.labels("true" if interrupted else "false").inc()
+    metrics.RERUN_SECONDS.observe(end - rerun["start"])
+    record = {
+        "ts": round(rerun["ts"], 3),
+        "total_ms": round((end - rerun["start"]) * 1000, 3),
+        "sections": {name: round(ms, 3) for name, ms in rerun["sections"].items()},
+        "calls": {name: {"count": count, "ms": round(ms, 3)} for name, (count, ms) in rerun["calls"].items()},
+        "interrupted": interrupted,
+    }
+    if user_data_bytes is not None:
+        record["user_data_bytes"] = user_data_bytes
+    with _lock:
+        _recent.append(record)
+        if log:
+            try:
+                with open(LOG_PATH, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError:
+                pass
+    return record
+
+
+def recent():
+    with _lock:
+        return list(_recent)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summary():
+    # Per-section and per-call statistics (ms) over the rolling window
+    samples = {"rerun total": []}
+    for record in recent():
+        samples["rerun total"].append(record["total_ms"])
+        for name, ms in record["sections"].items():
+            samples.setdefault(name, []).append(ms)
+        for name, call in record["calls"].items():
+            samples.setdefault(f"{name}()", []).append(call["ms"])
+    rows = []
+    for name, values in samples.items():
+        if not values:
+            continue
+        rows.append({
+            "Section": name,
+            "Count": len(values),
+            "Last": round(values[-1], 2),
+            "Mean": round(sum(values) / len(values), 2),
+            "p50": round(_percentile(values, 0.5), 2),
+            "p95": round(_percentile(values, 0.95), 2),
+            "Max": round(max(values), 2),
+        })
+    return rows
+
+
+def histogram(name="rerun total"):
+    # Bucket label -> count for one section (or whole reruns) over the rolling window
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for record in recent():
+        ms = record["total_ms"] if name == "rerun total" else record["sections"].get(name)
+        if ms is None:
+            continue
+        index = next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))
+        counts[index] += 1
+    labels = [f"≤{bound} ms" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]} ms"]
+    return dict(zip(labels, counts))
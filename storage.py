@@ -0,0 +1,1074 @@
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from datetime import date as date_type, timedelta
+
+import metrics
+from entries import ENTRY_TYPES, Interner, TOTAL_FIELDS, compact_days, pack_document, to_json, unpack_document
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on Windows; concurrent writers there are only safe within one process
+    fcntl = None
+
+DATA_DIR = "calorie_data"
+
+# Backend and directory layout used by open_storage() when none is given, overridable per deployment
+DEFAULT_BACKEND = os.environ.get("CALORIE_STORAGE", "segments")
+DEFAULT_LAYOUT = os.environ.get("CALORIE_STORAGE_LAYOUT", "sharded")
+DEFAULT_USER = os.environ.get("CALORIE_USER", "default")
+
+# Sharded layout: users/<h[0:2]>/<h[2:4]>/<h>/ with h = sha1(user id), plus an append-only index
+USERS_DIR = "users"
+USER_INDEX = "index.jsonl"
+LAYOUTS = ("single", "sharded")
+
+# Previous snapshots kept as tracker.json.1 (newest) .. tracker.json.N for recovery
+SNAPSHOT_GENERATIONS = 3
+
+# First line of a snapshot file; the JSON document follows on the next line
+SNAPSHOT_MAGIC = b'{"format": "calorie-tracker-snapshot"'
+
+# Files a single-layout install keeps in DATA_DIR, moved into the default user's shard on first use
+LEGACY_FILES = (
+    "tracker.json", "tracker.rev", "tracker.journal", "tracker.journal.1", "tracker.db", "tracker.db-wal", "tracker.db-shm",
+    "months",
+) + tuple(f"tracker.json.{index}" for index in range(1, SNAPSHOT_GENERATIONS + 1))
+
+# Top-level keys of user_data that hold per-date history ("YYYY-MM-DD" -> value)
+DAY_SECTIONS = ("meals", "workouts", "water_intake", "weight_log", "daily_totals")
+
+# Day sections holding lists of logged entries; appends to them commute between writers
+ENTRY_SECTIONS = ("meals", "workouts", "water_intake")
+
+# Day sections split into monthly segments; the weight log is one number a day and stays whole
+SEGMENT_SECTIONS = ("meals", "workouts", "water_intake", "daily_totals")
+
+# Compression for monthly segments, by name -> (file extension, compress, decompress)
+SEGMENT_CODECS = {
+    "gzip": (".json.gz", gzip.compress, gzip.decompress),
+    "lzma": (".json.xz", lzma.compress, lzma.decompress),
+}
+SEGMENT_CODEC = os.environ.get("CALORIE_SEGMENT_CODEC", "gzip")
+
+# Keys describing the document in memory rather than stored data; never written
+TRANSIENT_FIELDS = ("cold_months", "edit_stamp")
+
+# Recent revisions whose sync point is kept for merging a stale writer's changes
+SYNC_POINTS = 16
+
+# Journal is folded into the snapshot once it grows past either limit
+JOURNAL_COMPACT_RECORDS = 500
+JOURNAL_COMPACT_BYTES = 512 * 1024
+
+
+def make_record(user_data, changed):
+    days = {}
+    for section, date in changed:
+        days.setdefault(section, {})[date] = user_data.get(section, {}).get(date)
+    fields = {key: value for key, value in user_data.items() if key not in DAY_SECTIONS and key not in TRANSIENT_FIELDS}
+    return {"days": days, "fields": fields}
+
+
+def apply_record(user_data, record):
+    for section, days in record.get("days", {}).items():
+        target = user_data.setdefault(section, {})
+        for date, value in days.items():
+            if value is None:
+                target.pop(date, None)
+            else:
+                target[date] = value
+    user_data.update(record.get("fields", {}))
+
+
+def read_journal(path):
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A crash mid-append leaves a torn line, never committed; later records
+                # (appended before the tail was repaired) are still valid
+                continue
+    return records
+
+
+def repair_journal(path):
+    # Truncates a torn last line left by a crash mid-append, so the next record starts
+    # on a line of its own; call with the file lock held
+    try:
+        f = open(path, "rb+")
+    except FileNotFoundError:
+        return
+    with f:
+        position = f.seek(0, os.SEEK_END)
+        if position == 0:
+            return
+        f.seek(position - 1)
+        if f.read(1) == b"\n":
+            return
+        while position > 0:
+            start = max(0, position - 4096)
+            f.seek(start)
+            chunk = f.read(position - start)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        f.truncate(position)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def file_revision(paths):
+    # (mtime_ns, size) of each backing file that exists, and their total size in bytes
+    revision = []
+    total = 0
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            revision.append(None)
+            continue
+        revision.append((stat.st_mtime_ns, stat.st_size))
+        total += stat.st_size
+    return tuple(revision), total
+
+
+def encode_snapshot(text):
+    # Header line with the body's length and SHA-256, so a torn or damaged file is detected
+    body = text.encode("utf-8")
+    header = {"format": "calorie-tracker-snapshot", "version": 1, "bytes": len(body), "sha256": hashlib.sha256(body).hexdigest()}
+    return json.dumps(header).encode("utf-8") + b"\n" + body
+
+
+def decode_snapshot(raw):
+    # Raises ValueError for a damaged snapshot; files written before checksums are plain JSON
+    if not raw.startswith(SNAPSHOT_MAGIC):
+        return json.loads(raw)
+    header_line, _, body = raw.partition(b"\n")
+    header = json.loads(header_line)
+    if len(body) != header["bytes"]:
+        raise ValueError(f"truncated: {len(body)} of {header['bytes']} bytes")
+    if hashlib.sha256(body).hexdigest() != header["sha256"]:
+        raise ValueError("checksum mismatch")
+    return json.loads(body)
+
+
+def read_snapshot_file(path, generations=SNAPSHOT_GENERATIONS):
+    # Newest intact generation as (document, path read); (None, None) when none exist.
+    # Raises ValueError if snapshots exist but every one is damaged.
+    errors = []
+    for candidate in [path] + [f"{path}.{index}" for index in range(1, generations + 1)]:
+        try:
+            with open(candidate, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            continue
+        try:
+            return decode_snapshot(raw), candidate
+        except ValueError as e:
+            errors.append(f"{os.path.basename(candidate)}: {e}")
+    if errors:
+        raise ValueError("no readable snapshot (" + "; ".join(errors) + ")")
+    return None, None
+
+
+def set_aside(path):
+    # Renames a damaged file to <path>.damaged (.damaged.1, ... if taken) so it stops being
+    # read but can still be recovered by hand; None if it was gone already
+    target, index = f"{path}.damaged", 0
+    while os.path.exists(target):
+        index += 1
+        target = f"{path}.damaged.{index}"
+    try:
+        os.replace(path, target)
+    except FileNotFoundError:
+        return None
+    return target
+
+
+def write_durable(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def fsync_dir(path):
+    # Makes renames inside `path` durable; directories cannot be opened on Windows
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def keep_generations(path, generations=SNAPSHOT_GENERATIONS):
+    # Shifts path.1 .. path.N-1 up by one and links the current file as path.1; call with
+    # the file lock held, right before the current file is replaced
+    if generations <= 0 or not os.path.exists(path):
+        return
+    for index in range(generations - 1, 0, -1):
+        older = f"{path}.{index}"
+        if os.path.exists(older):
+            os.replace(older, f"{path}.{index + 1}")
+    try:
+        os.link(path, f"{path}.1")
+    except OSError:
+        shutil.copyfile(path, f"{path}.1")
+
+
+def stage_files(files, suffix):
+    # Writes each (path, text, encode) durably to a temporary file beside it; text None
+    # marks a file to delete. Returns [(temporary path or None, path, text)] for install.
+    staged = []
+    try:
+        for path, text, encode in files:
+            if text is None:
+                staged.append((None, path, None))
+                continue
+            tmp_path = f"{path}.{suffix}.tmp"
+            staged.append((tmp_path, path, text))
+            write_durable(tmp_path, encode(text))
+    except BaseException:
+        discard_staged(staged)
+        raise
+    return staged
+
+
+def discard_staged(staged):
+    for tmp_path, _, _ in staged:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def hot_months(today=None):
+    # "YYYY-MM" of the current and previous month, kept in the snapshot by SegmentStorage
+    first = (today or date_type.today()).replace(day=1)
+    return {first.isoformat()[:7], (first - timedelta(days=1)).isoformat()[:7]}
+
+
+def in_range(date, start, end):
+    return (start is None or date >= start) and (end is None or date <= end)
+
+
+class ConflictError(Exception):
+    # save() found a newer stored revision than the one the document was read at
+
+    def __init__(self, stored_revision):
+        super().__init__(f"stored revision {stored_revision} is newer than the document's")
+        self.stored_revision = stored_revision
+
+
+_held_locks = threading.local()
+
+
+@contextmanager
+def file_lock(path):
+    # Exclusive advisory lock, normally held only around the revision check and the final
+    # write/rename. Re-entrant per thread, so a writer can hold it across reload and save.
+    held = getattr(_held_locks, "paths", None)
+    if held is None:
+        held = _held_locks.paths = set()
+    if path in held:
+        yield
+        return
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        held.add(path)
+        try:
+            yield
+        finally:
+            held.discard(path)
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SyncPoints:
+    # What this process last read or wrote at each recent revision: the profile fields,
+    # the length of every day's entry list and the weight log. Entries past those lengths
+    # in a stale document are that writer's own appends; a weight that differs is its edit.
+
+    def __init__(self, keep=SYNC_POINTS):
+        self.keep = keep
+        self._points = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, revision):
+        with self._lock:
+            return self._points.get(revision)
+
+    def point(self, user_data, changed=None, base=None):
+        # Sync point for user_data as it is now; with `changed`, derived from the point at
+        # revision `base` instead of counting every day again
+        fields = {key: value for key, value in user_data.items() if key not in DAY_SECTIONS}
+        previous = self.get(base) if changed is not None else None
+        if previous is None:
+            lengths = {
+                (section, date): len(entries)
+                for section in ENTRY_SECTIONS for date, entries in user_data.get(section, {}).items()
+            }
+            weights = dict(user_data.get("weight_log", {}))
+        else:
+            lengths = dict(previous["lengths"])
+            weights = dict(previous["weights"])
+            for section, date in changed:
+                if section in ENTRY_SECTIONS:
+                    lengths[(section, date)] = len(user_data[section].get(date) or [])
+                elif section == "weight_log":
+                    if date in user_data["weight_log"]:
+                        weights[date] = user_data["weight_log"][date]
+                    else:
+                        weights.pop(date, None)
+        return {"fields": fields, "lengths": lengths, "weights": weights}
+
+    def add(self, revision, point):
+        with self._lock:
+            self._points[revision] = point
+            while len(self._points) > self.keep:
+                self._points.popitem(last=False)
+
+    def remember(self, user_data):
+        self.add(user_data.get("revision", 0), self.point(user_data))
+
+    def extend(self, revision, lengths):
+        # Adds days read into a document after its revision was remembered
+        with self._lock:
+            point = self._points.get(revision)
+            if point is not None:
+                self._points[revision] = {**point, "lengths": {**point["lengths"], **lengths}}
+
+
+class JsonStorage:
+    # Whole document in a single JSON file, rewritten on every save. Every save bumps
+    # user_data["revision"]; the latest one is kept in tracker.rev and a save from a
+    # document read at an older revision raises ConflictError instead of overwriting.
+    # Snapshots are fsynced before the rename and carry a checksum; if the current one is
+    # damaged, load() falls back to the newest intact generation and sets recovered_from.
+
+    def __init__(self, data_dir=DATA_DIR, filename="tracker.json", user=DEFAULT_USER):
+        self.data_dir = data_dir
+        self.user = user
+        self.path = os.path.join(data_dir, filename)
+        self.revision_path = os.path.splitext(self.path)[0] + ".rev"
+        self.lock_path = os.path.splitext(self.path)[0] + ".lock"
+        self.sync_points = SyncPoints()
+        self.recovered_from = None
+        # Food names and times read for this user, shared by all their entries
+        self.names = Interner()
+        os.makedirs(data_dir, exist_ok=True)
+
+    def read_snapshot(self):
+        user_data, source = read_snapshot_file(self.path)
+        self.recovered_from = source if source != self.path else None
+        return None if user_data is None else unpack_document(user_data, self.names)
+
+    def load(self):
+        user_data = self.read_snapshot()
+        if user_data is not None:
+            self.loaded(user_data)
+        return user_data
+
+    def loaded(self, user_data):
+        revision = user_data.get("revision", 0)
+        if self.recovered_from is not None and revision < self.stored_revision():
+            # Later revisions are unreadable; carry on from the recovered generation
+            user_data["revision"] = self.stored_revision()
+        elif revision > self.stored_revision():
+            # Written by a process that died before recording the revision
+            with file_lock(self.lock_path):
+                if revision > self.stored_revision():
+                    self.commit_revision(revision)
+        self.sync_points.remember(user_data)
+
+    def files(self):
+        return [self.path]
+
+    def revision(self):
+        return file_revision(self.files())
+
+    def stored_revision(self):
+        try:
+            with open(self.revision_path, "r") as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def check_revision(self, base):
+        # Call with the file lock held
+        stored = self.stored_revision()
+        if stored != base:
+            raise ConflictError(stored)
+
+    def commit_revision(self, revision):
+        tmp_path = self.revision_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(revision))
+        os.replace(tmp_path, self.revision_path)
+
+    def sync_point(self, revision):
+        return self.sync_points.get(revision)
+
+    def exclusive(self):
+        return file_lock(self.lock_path)
+
+    def load_history(self, user_data, start=None, lock=None):
+        # Every day is read by load(); see SegmentStorage
+        pass
+
+    def load_days(self, start=None, end=None):
+        user_data = self.read_snapshot() or {}
+        self.load_history(user_data, start)
+        return {
+            section: {date: value for date, value in user_data.get(section, {}).items() if in_range(date, start, end)}
+            for section in DAY_SECTIONS
+        }
+
+    def save(self, user_data, changed=None, force=False):
+        user_data["revision"] = self.commit(self.prepare(user_data, changed, force))
+
+    def prepare(self, user_data, changed=None, force=False):
+        # Serializes the save; commit() then only does file I/O, so callers can guard the
+        # document with their own lock for this step alone. force=True saves over
+        # whatever revision is stored now.
+        base = self.stored_revision() if force else user_data.get("revision", 0)
+        return {
+            "base": base,
+            "changed": None,
+            "files": self.snapshot_files(user_data, base + 1),
+            "point": self.sync_points.point(user_data),
+        }
+
+    def snapshot_files(self, user_data, revision):
+        # (path, text, encode) for every file a full snapshot writes, the main file last
+        document = {key: value for key, value in user_data.items() if key not in TRANSIENT_FIELDS}
+        document["revision"] = revision
+        return [(self.path, json.dumps(pack_document(document), separators=(",", ":")), encode_snapshot)]
+
+    def commit(self, prepared):
+        # Writes a prepared save unless another writer moved the revision; returns the new one
+        revision = prepared["base"] + 1
+        staged = stage_files(prepared["files"], f"{os.getpid()}.{threading.get_ident()}")
+        try:
+            written = sum(os.path.getsize(tmp_path) for tmp_path, _, _ in staged if tmp_path is not None)
+            with file_lock(self.lock_path):
+                self.check_revision(prepared["base"])
+                self.install(staged)
+                self.snapshot_written()
+                self.commit_revision(revision)
+        finally:
+            discard_staged(staged)
+        metrics.WRITE_BYTES.observe(written)
+        self.sync_points.add(revision, prepared["point"])
+        return revision
+
+    def install(self, staged):
+        # Renames staged files into place, keeping generations of the main snapshot;
+        # call with the file lock held
+        for tmp_path, path, _ in staged:
+            if tmp_path is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            if path == self.path:
+                keep_generations(path)
+            os.replace(tmp_path, path)
+        for directory in sorted({os.path.dirname(path) for _, path, _ in staged}):
+            fsync_dir(directory)
+
+    def snapshot_written(self):
+        pass
+
+
+class JournalStorage(JsonStorage):
+    # Snapshot in tracker.json plus an append-only tracker.journal of per-event records.
+    # save(changed=[(section, date), ...]) appends one record holding only the touched
+    # days and the scalar profile fields; save() without changes writes a full snapshot.
+
+    def __init__(self, data_dir=DATA_DIR, filename="tracker.json", user=DEFAULT_USER):
+        super().__init__(data_dir, filename, user)
+        self.journal_path = os.path.splitext(self.path)[0] + ".journal"
+        self.rotated_path = self.journal_path + ".1"
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._compacting = False
+        self._records = 0
+        self._bytes = 0
+        if os.path.exists(self.journal_path):
+            with file_lock(self.lock_path):
+                repair_journal(self.journal_path)
+            self._records = len(read_journal(self.journal_path))
+            self._bytes = os.path.getsize(self.journal_path)
+
+    def files(self):
+        return [self.path, self.rotated_path, self.journal_path]
+
+    def load(self):
+        with self._lock:
+            user_data = self.read_snapshot()
+            tail = read_journal(self.rotated_path) + read_journal(self.journal_path)
+        if user_data is None and not tail:
+            return None
+        if user_data is None:
+            user_data = {}
+        for record in tail:
+            apply_record(user_data, record)
+            compact_days(user_data, record.get("days", {}), self.names)
+        for section in DAY_SECTIONS:
+            user_data.setdefault(section, {})
+        self.loaded(user_data)
+        return user_data
+
+    def prepare(self, user_data, changed=None, force=False):
+        if changed is None:
+            return super().prepare(user_data, changed, force)
+        base = self.stored_revision() if force else user_data.get("revision", 0)
+        record = make_record(user_data, changed)
+        record["fields"]["revision"] = base + 1
+        return {
+            "base": base,
+            "changed": changed,
+            "data": json.dumps(record, separators=(",", ":"), default=to_json) + "\n",
+            "point": self.sync_points.point(user_data, changed, user_data.get("revision", 0)),
+        }
+
+    def commit(self, prepared):
+        if prepared["changed"] is None:
+            return super().commit(prepared)
+        revision = prepared["base"] + 1
+        line = prepared["data"]
+        with file_lock(self.lock_path):
+            self.check_revision(prepared["base"])
+            repair_journal(self.journal_path)
+            with open(self.journal_path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.commit_revision(revision)
+            with self._lock:
+                self._records += 1
+                self._bytes += len(line)
+                compact = not self._compacting and (
+                    self._records >= JOURNAL_COMPACT_RECORDS or self._bytes >= JOURNAL_COMPACT_BYTES
+                )
+                if compact:
+                    generation = self._rotate()
+        metrics.WRITE_BYTES.observe(len(line))
+        self.sync_points.add(revision, prepared["point"])
+        if compact:
+            threading.Thread(target=self._compact, args=(generation,), daemon=True).start()
+        return revision
+
+    def snapshot_written(self):
+        with self._lock:
+            self._discard_journal()
+
+    def compact(self):
+        with file_lock(self.lock_path), self._lock:
+            if self._compacting:
+                return
+            generation = self._rotate()
+        self._compact(generation)
+
+    def _discard_journal(self):
+        for path in (self.journal_path, self.rotated_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._records = 0
+        self._bytes = 0
+        self._generation += 1
+
+    def _rotate(self):
+        # New appends go to a fresh journal while the rotated one is folded in.
+        # A rotated journal left behind by an interrupted compaction is merged first.
+        # Called with the file lock and then self._lock held, the order used throughout.
+        if not os.path.exists(self.rotated_path) and os.path.exists(self.journal_path):
+            os.replace(self.journal_path, self.rotated_path)
+            self._records = 0
+            self._bytes = 0
+        self._compacting = True
+        return self._generation
+
+    def _compact(self, generation):
+        staged = []
+        try:
+            snapshot_revision = file_revision([self.path])[0]
+            rotated = os.path.exists(self.rotated_path)
+            user_data = self.read_snapshot() or {}
+            for record in read_journal(self.rotated_path):
+                apply_record(user_data, record)
+            for section in DAY_SECTIONS:
+                user_data.setdefault(section, {})
+            files = self.snapshot_files(user_data, user_data.get("revision", 0))
+            staged = stage_files(files, f"{os.getpid()}.compact")
+            with file_lock(self.lock_path), self._lock:
+                # A full snapshot written meanwhile, here or by another process, already
+                # supersedes this one
+                current = generation == self._generation and (os.path.exists(self.rotated_path) or not rotated)
+                if current and file_revision([self.path])[0] == snapshot_revision:
+                    self.install(staged)
+                    if rotated:
+                        os.remove(self.rotated_path)
+        finally:
+            discard_staged(staged)
+            with self._lock:
+                self._compacting = False
+
+
+
+class SegmentStorage(JournalStorage):
+    # Journal storage with history split by month. The snapshot keeps the current and
+    # previous month of entries and day totals, plus the whole weight log; older months
+    # are checksummed, compressed segments in months/YYYY-MM.json.gz. load() leaves those
+    # on disk and lists them in user_data["cold_months"]; load_history() reads them in
+    # when a date range, export or replay reaches back that far, and must come before
+    # editing days in those months, since a saved day replaces the stored one. A segment
+    # found damaged while saving is set aside, listed in damaged_segments, and rewritten
+    # from the days the document holds for its month.
+
+    def __init__(self, data_dir=DATA_DIR, filename="tracker.json", user=DEFAULT_USER):
+        super().__init__(data_dir, filename, user)
+        self.months_dir = os.path.join(data_dir, "months")
+        # month -> SHA-256 of the segment as last read or written here, to skip rewrites
+        self._digests = {}
+        # Returns the date deciding which months are hot; replaced by tools with their own clock
+        self.today = date_type.today
+        # Paths damaged segments were moved to, newest last
+        self.damaged_segments = []
+
+    def stored_months(self):
+        # "YYYY-MM" -> segment path, for segments in any codec
+        months = {}
+        try:
+            names = os.listdir(self.months_dir)
+        except FileNotFoundError:
+            return months
+        for name in sorted(names):
+            for extension, _, _ in SEGMENT_CODECS.values():
+                if name.endswith(extension):
+                    months[name[: -len(extension)]] = os.path.join(self.months_dir, name)
+        return months
+
+    def segment_path(self, month):
+        return os.path.join(self.months_dir, month + SEGMENT_CODECS[SEGMENT_CODEC][0])
+
+    def encode_segment(self, text):
+        return SEGMENT_CODECS[SEGMENT_CODEC][1](encode_snapshot(text))
+
+    def read_segment(self, month, path):
+        # Day sections stored for `month`; raises ValueError for a damaged segment
+        decompress = next(codec[2] for codec in SEGMENT_CODECS.values() if path.endswith(codec[0]))
+        try:
+            with open(path, "rb") as f:
+                raw = decompress(f.read())
+        except FileNotFoundError:
+            return {}
+        except (OSError, EOFError, lzma.LZMAError) as e:
+            raise ValueError(f"{os.path.basename(path)}: {e}")
+        try:
+            days = unpack_document(decode_snapshot(raw), self.names)
+        except ValueError as e:
+            raise ValueError(f"{os.path.basename(path)}: {e}")
+        self._digests[month] = json.loads(raw.partition(b"\n")[0])["sha256"]
+        return days
+
+    def read_snapshot(self):
+        user_data = super().read_snapshot()
+        months = sorted(self.stored_months())
+        if user_data is None and months:
+            raise ValueError("monthly segments found without a snapshot")
+        if user_data is not None:
+            user_data["cold_months"] = months
+        return user_data
+
+    def load(self):
+        user_data = super().load()
+        if user_data is not None:
+            hot = hot_months(self.today())
+            if any(date[:7] not in hot for section in SEGMENT_SECTIONS for date in user_data.get(section, {})):
+                # Months that went cold since the last snapshot move to segments in the background
+                threading.Thread(target=self.compact, daemon=True).start()
+        return user_data
+
+    def load_history(self, user_data, start=None, lock=None):
+        # Reads cold months from `start` ("YYYY-MM-DD", None for all) into user_data.
+        # Segments are read without `lock`, which only guards adding the days; a day the
+        # document already holds is newer than its segment and is kept.
+        months = [month for month in user_data.get("cold_months", ()) if start is None or month >= start[:7]]
+        if not months:
+            return
+        stored = self.stored_months()
+        segments = [self.read_segment(month, stored[month]) for month in months if month in stored]
+        with lock or nullcontext():
+            lengths = {}
+            for days in segments:
+                for section, values in days.items():
+                    target = user_data.setdefault(section, {})
+                    for date, value in values.items():
+                        if date not in target:
+                            target[date] = value
+                            if section in ENTRY_SECTIONS:
+                                lengths[(section, date)] = len(value)
+            user_data["cold_months"] = [month for month in user_data.get("cold_months", ()) if month not in months]
+            self.sync_points.extend(user_data.get("revision", 0), lengths)
+
+    def prepare(self, user_data, changed=None, force=False):
+        if changed is not None:
+            hot = hot_months(self.today())
+            if any(section in SEGMENT_SECTIONS and date[:7] not in hot for section, date in changed):
+                # Days of cold months are only written to their segments
+                changed = None
+        return super().prepare(user_data, changed, force)
+
+    def snapshot_files(self, user_data, revision):
+        # Hot months go to the snapshot, each older month to its segment. A month still
+        # cold in this document is merged into its segment day by day; a loaded month
+        # is rewritten only if it changed.
+        hot = hot_months(self.today())
+        cold = set(user_data.get("cold_months", ()))
+        document = {key: value for key, value in user_data.items() if key not in TRANSIENT_FIELDS}
+        document["revision"] = revision
+        months = {}
+        for section in SEGMENT_SECTIONS:
+            days = document[section] = {}
+            for date, value in user_data.get(section, {}).items():
+                if date[:7] in hot:
+                    days[date] = value
+                else:
+                    months.setdefault(date[:7], {}).setdefault(section, {})[date] = value
+        stored = self.stored_months()
+        if months:
+            os.makedirs(self.months_dir, exist_ok=True)
+        files = []
+        for month, days in sorted(months.items()):
+            if month in cold and month in stored:
+                try:
+                    merged = self.read_segment(month, stored[month])
+                except ValueError:
+                    # Otherwise every full save and compaction would fail on it
+                    moved = set_aside(stored[month])
+                    if moved is not None:
+                        self.damaged_segments.append(moved)
+                    self._digests.pop(month, None)
+                    del stored[month]
+                    merged = {}
+                for section, values in days.items():
+                    merged.setdefault(section, {}).update(values)
+                days = merged
+            text = json.dumps(pack_document(days), separators=(",", ":"))
+            path = self.segment_path(month)
+            if stored.get(month) == path and self._digests.get(month) == hashlib.sha256(text.encode("utf-8")).hexdigest():
+                continue
+            files.append((path, text, self.encode_segment))
+            if month in stored and stored[month] != path:
+                files.append((stored[month], None, None))
+        if "cold_months" not in user_data:
+            # A document that never listed cold months (a reset, a migration) is all the history
+            files.extend((path, None, None) for month, path in stored.items() if month not in months)
+        files.append((self.path, json.dumps(pack_document(document), separators=(",", ":")), encode_snapshot))
+        return files
+
+    def install(self, staged):
+        super().install(staged)
+        for tmp_path, path, text in staged:
+            month = os.path.basename(path)[:7]
+            if path == self.path or path != self.segment_path(month):
+                continue
+            if tmp_path is None:
+                self._digests.pop(month, None)
+            else:
+                self._digests[month] = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class SqliteStorage:
+    # Normalized tables per history section, indexed on (user, date). Profile fields
+    # (level, goals, counters, ...) are kept as one JSON row per user.
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS profile (user TEXT PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS meals (
+            id INTEGER PRIMARY KEY, user TEXT NOT NULL, date TEXT NOT NULL, name TEXT NOT NULL,
+            calories NUMERIC, protein NUMERIC, carbs NUMERIC, fat NUMERIC, time TEXT
+        );
+        CREATE TABLE IF NOT EXISTS workouts (
+            id INTEGER PRIMARY KEY, user TEXT NOT NULL, date TEXT NOT NULL, name TEXT NOT NULL,
+            calories_burned NUMERIC, time TEXT
+        );
+        CREATE TABLE IF NOT EXISTS water_intake (
+            id INTEGER PRIMARY KEY, user TEXT NOT NULL, date TEXT NOT NULL, amount_ml NUMERIC, time TEXT
+        );
+        CREATE TABLE IF NOT EXISTS weight_log (
+            user TEXT NOT NULL, date TEXT NOT NULL, weight NUMERIC, PRIMARY KEY (user, date)
+        );
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            user TEXT NOT NULL, date TEXT NOT NULL, calories NUMERIC, protein NUMERIC, carbs NUMERIC, fat NUMERIC,
+            burned NUMERIC, water_ml NUMERIC, meal_count INTEGER, workout_count INTEGER, water_count INTEGER,
+            PRIMARY KEY (user, date)
+        );
+        CREATE INDEX IF NOT EXISTS meals_user_date ON meals (user, date);
+        CREATE INDEX IF NOT EXISTS workouts_user_date ON workouts (user, date);
+        CREATE INDEX IF NOT EXISTS water_intake_user_date ON water_intake (user, date);
+    """
+
+    # Entry columns per list section, in insert order
+    COLUMNS = {section: entry_type.fields for section, entry_type in ENTRY_TYPES.items()}
+    TOTAL_COLUMNS = TOTAL_FIELDS
+
+    def __init__(self, data_dir=DATA_DIR, filename="tracker.db", user=DEFAULT_USER):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, filename)
+        self.user = user
+        self.lock_path = os.path.splitext(self.path)[0] + ".lock"
+        self.sync_points = SyncPoints()
+        self.recovered_from = None
+        self.names = Interner()
+        os.makedirs(data_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        # One short-lived connection per call: Streamlit runs sessions on separate threads
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return _Transaction(conn)
+
+    def files(self):
+        return [self.path, self.path + "-wal"]
+
+    def revision(self):
+        return file_revision(self.files())
+
+    def stored_revision(self, conn=None):
+        if conn is None:
+            with self._connect() as conn:
+                return self.stored_revision(conn)
+        row = conn.execute("SELECT json_extract(data, '$.revision') FROM profile WHERE user = ?", (self.user,)).fetchone()
+        return (row and row[0]) or 0
+
+    def sync_point(self, revision):
+        return self.sync_points.get(revision)
+
+    def exclusive(self):
+        return file_lock(self.lock_path)
+
+    def load(self):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM profile WHERE user = ?", (self.user,)).fetchone()
+            if row is None:
+                return self._migrate_legacy()
+            user_data = json.loads(row[0])
+            user_data.update(self._read_days(conn, None, None))
+        self.sync_points.remember(user_data)
+        return user_data
+
+    def load_history(self, user_data, start=None, lock=None):
+        # load() reads every row; ranges are read with load_days()
+        pass
+
+    def load_days(self, start=None, end=None):
+        with self._connect() as conn:
+            return self._read_days(conn, start, end)
+
+    def save(self, user_data, changed=None, force=False):
+        user_data["revision"] = self.commit(self.prepare(user_data, changed, force))
+
+    def prepare(self, user_data, changed=None, force=False):
+        base = self.stored_revision() if force else user_data.get("revision", 0)
+        fields = {key: value for key, value in user_data.items() if key not in DAY_SECTIONS and key not in TRANSIENT_FIELDS}
+        fields["revision"] = base + 1
+        # (section, date or None for the whole section, rows to insert)
+        if changed is None:
+            days = [
+                (section, None, [row for date, value in user_data.get(section, {}).items() for row in self._rows(section, date, value)])
+                for section in DAY_SECTIONS
+            ]
+            point = self.sync_points.point(user_data)
+        else:
+            days = []
+            for section, date in changed:
+                value = user_data.get(section, {}).get(date)
+                days.append((section, date, [] if value is None else self._rows(section, date, value)))
+            point = self.sync_points.point(user_data, changed, user_data.get("revision", 0))
+        return {"base": base, "changed": changed, "data": (json.dumps(fields), days), "point": point}
+
+    def commit(self, prepared):
+        # The revision check runs inside the write transaction; the advisory lock around it
+        # lets a writer that keeps losing hold off the others over its merge (exclusive())
+        profile, days = prepared["data"]
+        with file_lock(self.lock_path), self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            stored = self.stored_revision(conn)
+            if stored != prepared["base"]:
+                raise ConflictError(stored)
+            conn.execute(
+                "INSERT INTO profile (user, data) VALUES (?, ?) ON CONFLICT(user) DO UPDATE SET data = excluded.data",
+                (self.user, profile),
+            )
+            for section, date, rows in days:
+                if date is None:
+                    conn.execute(f"DELETE FROM {section} WHERE user = ?", (self.user,))
+                else:
+                    conn.execute(f"DELETE FROM {section} WHERE user = ? AND date = ?", (self.user, date))
+                if rows:
+                    conn.executemany(self._insert_sql(section), rows)
+        # Row payload approximated by its text form; page and index overhead not counted
+        metrics.WRITE_BYTES.observe(len(profile) + sum(len(str(row)) for _, _, rows in days for row in rows))
+        revision = prepared["base"] + 1
+        self.sync_points.add(revision, prepared["point"])
+        return revision
+
+    def _rows(self, section, date, value):
+        if section == "weight_log":
+            return [(self.user, date, value)]
+        if section == "daily_totals":
+            return [(self.user, date) + tuple(value.get(column, 0) for column in self.TOTAL_COLUMNS)]
+        columns = self.COLUMNS[section]
+        return [(self.user, date) + tuple(entry.get(column) for column in columns) for entry in value]
+
+    def _insert_sql(self, section):
+        if section == "weight_log":
+            columns = ("weight",)
+        elif section == "daily_totals":
+            columns = self.TOTAL_COLUMNS
+        else:
+            columns = self.COLUMNS[section]
+        return f"INSERT INTO {section} (user, date, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 2))})"
+
+    def _read_days(self, conn, start, end):
+        where = "user = ?"
+        params = [self.user]
+        if start is not None:
+            where += " AND date >= ?"
+            params.append(start)
+        if end is not None:
+            where += " AND date <= ?"
+            params.append(end)
+        days = {section: {} for section in DAY_SECTIONS}
+        for section, columns in self.COLUMNS.items():
+            rows = conn.execute(f"SELECT date, {', '.join(columns)} FROM {section} WHERE {where} ORDER BY date, id", params)
+            entry_type = ENTRY_TYPES[section]
+            named = columns[0] == "name"
+            target = days[section]
+            for date, *values in rows:
+                if named:
+                    values[0] = self.names(values[0])
+                values[-1] = self.names(values[-1])
+                target.setdefault(date, []).append(entry_type(*values))
+        for date, weight in conn.execute(f"SELECT date, weight FROM weight_log WHERE {where} ORDER BY date", params):
+            days["weight_log"][date] = weight
+        columns = self.TOTAL_COLUMNS
+        for row in conn.execute(f"SELECT date, {', '.join(columns)} FROM daily_totals WHERE {where}", params):
+            days["daily_totals"][row[0]] = dict(zip(columns, row[1:]))
+        return days
+
+    def _migrate_legacy(self):
+        # First run on SQLite: pick up an existing tracker.json/journal so history carries over
+        legacy = SegmentStorage(self.data_dir, user=self.user)
+        user_data = legacy.load()
+        if user_data is not None:
+            legacy.load_history(user_data)
+            self.save(user_data, force=True)
+        return user_data
+
+
+class _Transaction:
+    # Commits on success, rolls back on error, and always closes the connection
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.conn.close()
+        return False
+
+
+STORAGE_BACKENDS = {
+    "json": JsonStorage,
+    "journal": JournalStorage,
+    "segments": SegmentStorage,
+    "sqlite": SqliteStorage,
+}
+
+
+def shard_path(user, data_dir=DATA_DIR):
+    digest = hashlib.sha1(user.encode("utf-8")).hexdigest()
+    return os.path.join(data_dir, USERS_DIR, digest[:2], digest[2:4], digest)
+
+
+def create_user(user, data_dir=DATA_DIR):
+    # Creates the user's shard directory and registers it in the index; idempotent
+    path = shard_path(user, data_dir)
+    try:
+        os.makedirs(path)
+    except FileExistsError:
+        return path
+    with open(os.path.join(data_dir, USERS_DIR, USER_INDEX), "a") as f:
+        f.write(json.dumps({"user": user, "path": os.path.relpath(path, data_dir)}) + "\n")
+    return path
+
+
+def list_users(data_dir=DATA_DIR):
+    index_path = os.path.join(data_dir, USERS_DIR, USER_INDEX)
+    if not os.path.exists(index_path):
+        return []
+    users = []
+    with open(index_path, "r") as f:
+        for line in f:
+            try:
+                users.append(json.loads(line)["user"])
+            except (ValueError, KeyError):
+                continue
+    return users
+
+
+def _migrate_single_layout(data_dir, path):
+    if os.listdir(path):
+        return
+    for filename in LEGACY_FILES:
+        legacy_path = os.path.join(data_dir, filename)
+        if os.path.exists(legacy_path):
+            os.replace(legacy_path, os.path.join(path, filename))
+
+
+def open_storage(backend=None, data_dir=DATA_DIR, user=None, layout=None):
+    backend = backend or DEFAULT_BACKEND
+    layout = layout or DEFAULT_LAYOUT
+    user = user or DEFAULT_USER
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend!r}, expected one of {sorted(STORAGE_BACKENDS)}")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown storage layout {layout!r}, expected one of {list(LAYOUTS)}")
+    if layout == "sharded":
+        user_dir = create_user(user, data_dir)
+        if user == DEFAULT_USER:
+            _migrate_single_layout(data_dir, user_dir)
+        data_dir = user_dir
+    return STORAGE_BACKENDS[backend](data_dir, user=user)
@@ -0,0 +1,547 @@
+import argparse
+import math
+import random
+import time
+from collections import Counter
+from contextlib import nullcontext
+from datetime import date as date_type, datetime, timedelta
+
+import achievements
+import metrics
+from entries import Meal, TOTAL_FIELDS, Water, Workout
+from storage import ConflictError, DAY_SECTIONS, open_storage, STORAGE_BACKENDS
+
+RANK_SYSTEM = [
+    {"rank": "BEGINNER", "min_points": 0, "emoji": "🌱"},
+    {"rank": "APPRENTICE", "min_points": 100, "emoji": "👨‍🍳"},
+    {"rank": "CHEF", "min_points": 250, "emoji": "🍽️"},
+    {"rank": "MASTER CHEF", "min_points": 500, "emoji": "👨‍🍳"},
+    {"rank": "NUTRITION EXPERT", "min_points": 1000, "emoji": "💚"},
+    {"rank": "HEALTH CHAMPION", "min_points": 2000, "emoji": "🏆"},
+    {"rank": "LEGEND", "min_points": 5000, "emoji": "👑"},
+]
+
+# XP granted per logged event
+EXPERIENCE = {"meal": 10, "workout": 15, "water": 5, "weight": 0, "daily_bonus": 25}
+
+# Rank points granted per level gained
+RANK_POINTS_PER_LEVEL = 20
+
+ENTRY_KINDS = {"meals": "meal", "workouts": "workout", "water_intake": "water"}
+COUNTERS = {"meal": "total_meals_logged", "workout": "total_workouts", "water": "total_water_logged"}
+
+# Profile fields that follow from the logged history; re-derived when concurrent writes are merged
+DERIVED_FIELDS = {
+    "level", "experience", "exp_needed", "rank", "rank_points", "total_meals_logged", "total_workouts",
+    "total_water_logged", "best_streak", "current_streak", "streak_start", "streak_last_date", "achievements",
+    "achievement_state", "revision", "cold_months", "edit_stamp",
+}
+
+# Optimistic retries, with jittered backoff, before a save takes the write lock for its merge
+SAVE_ATTEMPTS = 4
+SAVE_BACKOFF_SECONDS = 0.005
+
+
+def new_user_data():
+    return {
+        "username": "Nutritionist",
+        "level": 1,
+        "experience": 0,
+        "exp_needed": 100,
+        "rank": "BEGINNER",
+        "rank_points": 0,
+        "daily_calorie_goal": 2000,
+        "daily_protein_goal": 150,
+        "daily_carbs_goal": 225,
+        "daily_fat_goal": 65,
+        "daily_water_goal": 2000,
+        "target_weight": 77,
+        "current_weight": 82,
+        "meals": {},
+        "workouts": {},
+        "water_intake": {},
+        "weight_log": {},
+        "daily_totals": {},
+        "achievements": [],
+        "achievement_state": achievements.initial_state(),
+        "last_saved": None,
+        "total_meals_logged": 0,
+        "total_workouts": 0,
+        "total_water_logged": 0,
+        "best_streak": 0,
+        "current_streak": 0,
+        "streak_start": None,
+        "streak_last_date": None,
+        "daily_bonus_claimed": False,
+        "last_bonus_date": None,
+    }
+
+
+def get_current_rank(rank_points):
+    for i in range(len(RANK_SYSTEM) - 1, -1, -1):
+        if rank_points >= RANK_SYSTEM[i]["min_points"]:
+            return RANK_SYSTEM[i]
+    return RANK_SYSTEM[0]
+
+
+def exp_needed_for(level):
+    return 100 + (level - 1) * 50
+
+
+def experience_to_reach(level):
+    # Sum of exp_needed over levels 1..level-1: 100n + 25n(n-1) with n = level - 1
+    n = level - 1
+    return 100 * n + 25 * n * (n - 1)
+
+
+def level_for_experience(total):
+    # Largest level whose cumulative requirement is <= total, i.e. the root of 25n^2 + 75n = total
+    n = int((math.isqrt(5625 + 100 * int(total)) - 75) // 50)
+    while experience_to_reach(n + 2) <= total:
+        n += 1
+    while n > 0 and experience_to_reach(n + 1) > total:
+        n -= 1
+    return n + 1
+
+
+def total_experience(user_data):
+    return experience_to_reach(user_data["level"]) + user_data["experience"]
+
+
+def grant_experience(user_data, amount):
+    # Closed-form equivalent of adding XP one level-up at a time; returns True on level-up
+    total = total_experience(user_data) + amount
+    level = level_for_experience(total)
+    gained = level - user_data["level"]
+    user_data["level"] = level
+    user_data["experience"] = total - experience_to_reach(level)
+    user_data["exp_needed"] = exp_needed_for(level)
+    user_data["rank_points"] += gained * RANK_POINTS_PER_LEVEL
+    user_data["rank"] = get_current_rank(user_data["rank_points"])["rank"]
+    return gained > 0
+
+
+def empty_totals():
+    return {field: 0 for field in TOTAL_FIELDS}
+
+
+def get_day_totals(user_data, date):
+    return user_data["daily_totals"].get(date) or empty_totals()
+
+
+def _day_totals_for_update(user_data, date):
+    daily_totals = user_data.setdefault("daily_totals", {})
+    if date not in daily_totals:
+        daily_totals[date] = empty_totals()
+    return daily_totals[date]
+
+
+def add_meal_totals(user_data, date, meal):
+    totals = _day_totals_for_update(user_data, date)
+    totals["calories"] += meal["calories"]
+    totals["protein"] += meal["protein"]
+    totals["carbs"] += meal["carbs"]
+    totals["fat"] += meal["fat"]
+    totals["meal_count"] += 1
+
+
+def add_workout_totals(user_data, date, workout):
+    totals = _day_totals_for_update(user_data, date)
+    totals["burned"] += workout["calories_burned"]
+    totals["workout_count"] += 1
+
+
+def add_water_totals(user_data, date, water):
+    totals = _day_totals_for_update(user_data, date)
+    totals["water_ml"] += water["amount_ml"]
+    totals["water_count"] += 1
+
+
+def compute_day_totals(user_data, date):
+    totals = empty_totals()
+    for meal in user_data["meals"].get(date, []):
+        totals["calories"] += meal["calories"]
+        totals["protein"] += meal["protein"]
+        totals["carbs"] += meal["carbs"]
+        totals["fat"] += meal["fat"]
+        totals["meal_count"] += 1
+    for workout in user_data["workouts"].get(date, []):
+        totals["burned"] += workout["calories_burned"]
+        totals["workout_count"] += 1
+    for water in user_data["water_intake"].get(date, []):
+        totals["water_ml"] += water["amount_ml"]
+        totals["water_count"] += 1
+    return totals
+
+
+def rebuild_daily_totals(user_data):
+    # Recompute every day's aggregate from the raw entries; returns the dates that disagreed
+    dates = set(user_data["meals"]) | set(user_data["workouts"]) | set(user_data["water_intake"])
+    stored = user_data.get("daily_totals", {})
+    rebuilt = {date: compute_day_totals(user_data, date) for date in sorted(dates)}
+    mismatched = sorted(
+        date for date in set(stored) | set(rebuilt)
+        if stored.get(date, empty_totals()) != rebuilt.get(date, empty_totals())
+    )
+    user_data["daily_totals"] = rebuilt
+    return mismatched
+
+
+def ensure_daily_totals(user_data):
+    # Documents saved before aggregates existed get them backfilled once
+    has_entries = user_data["meals"] or user_data["workouts"] or user_data["water_intake"]
+    if not user_data.get("daily_totals") and has_entries:
+        rebuild_daily_totals(user_data)
+        return True
+    user_data.setdefault("daily_totals", {})
+    return False
+
+
+def _previous_day(date):
+    return (date_type.fromisoformat(date) - timedelta(days=1)).isoformat()
+
+
+def record_meal_day(user_data, date):
+    # A meal on `date` extends the run if the previous meal day was the day before
+    last = user_data.get("streak_last_date")
+    if last == date:
+        return
+    if last is not None and last == _previous_day(date):
+        user_data["current_streak"] += 1
+    else:
+        user_data["current_streak"] = 1
+        user_data["streak_start"] = date
+    user_data["streak_last_date"] = date
+    if user_data["current_streak"] > user_data.get("best_streak", 0):
+        user_data["best_streak"] = user_data["current_streak"]
+
+
+def roll_streak(user_data, today):
+    # Day rollover: a run whose last meal day is before yesterday is broken
+    last = user_data.get("streak_last_date")
+    if last is not None and last != today and last != _previous_day(today):
+        user_data["current_streak"] = 0
+        user_data["streak_start"] = None
+        user_data["streak_last_date"] = None
+
+
+def get_streak(user_data, today):
+    # Consecutive meal days ending today; 0 until today's first meal is logged
+    if user_data.get("streak_last_date") == today:
+        return user_data["current_streak"]
+    return 0
+
+
+def backfill_streaks(user_data):
+    # Derive streak state from history in one pass over the sorted meal dates
+    current = best = 0
+    start = last = None
+    for date in sorted(date for date, meals in user_data["meals"].items() if meals):
+        if last is not None and _previous_day(date) == last:
+            current += 1
+        else:
+            current = 1
+            start = date
+        last = date
+        best = max(best, current)
+    user_data["current_streak"] = current
+    user_data["streak_start"] = start
+    user_data["streak_last_date"] = last
+    user_data["best_streak"] = max(best, user_data.get("best_streak", 0))
+
+
+def ensure_streaks(user_data):
+    if "streak_last_date" not in user_data:
+        backfill_streaks(user_data)
+        return True
+    return False
+
+
+def _new_entries(stored_entries, entries, base_length):
+    if base_length is not None:
+        return entries[base_length:]
+    # No sync point for the writer's revision: whatever is not stored yet is its own
+    remaining = Counter(tuple(sorted(entry.items())) for entry in stored_entries)
+    new = []
+    for entry in entries:
+        key = tuple(sorted(entry.items()))
+        if remaining[key]:
+            remaining[key] -= 1
+        else:
+            new.append(entry)
+    return new
+
+
+def merge_concurrent(stored, session, base, changed=None):
+    # Re-applies what `session` changed since `base` (its storage sync point) on top of the
+    # newer `stored` document. Appends commute, so each changed day keeps the other
+    # writer's entries plus the session's; profile fields the session edited win, and XP,
+    # counters, totals, streaks and achievements are re-derived from the merged entries.
+    if changed is None:
+        changed = [(section, date) for section in (*ENTRY_KINDS, "weight_log") for date in session.get(section, {})]
+    experience = 0
+    latest = max(stored["daily_totals"], default=None)
+    events = []
+    for section, date in changed:
+        if section == "weight_log":
+            # Only a weight the session changed since `base`, or a newer one saved by the
+            # other writer would be overwritten with a stale value
+            if date in session["weight_log"] and not (base and session["weight_log"][date] == base["weights"].get(date)):
+                stored["weight_log"][date] = session["weight_log"][date]
+                events.append(("weight", date, {"weight": stored["weight_log"][date]}))
+            continue
+        if section not in ENTRY_KINDS:
+            continue
+        day = stored[section].setdefault(date, [])
+        base_length = base["lengths"].get((section, date), 0) if base else None
+        new = _new_entries(day, session[section].get(date, []), base_length)
+        if not new:
+            if not day:
+                del stored[section][date]
+            continue
+        kind = ENTRY_KINDS[section]
+        day.extend(new)
+        day.sort(key=lambda entry: entry["time"])
+        stored[COUNTERS[kind]] += len(new)
+        experience += EXPERIENCE[kind] * len(new)
+        events.extend((kind, date, entry) for entry in new)
+
+    if base:
+        bonus_date = session.get("last_bonus_date")
+        if bonus_date != base["fields"].get("last_bonus_date") and bonus_date != stored.get("last_bonus_date"):
+            experience += EXPERIENCE["daily_bonus"]
+        for key, value in session.items():
+            if key not in DAY_SECTIONS and key not in DERIVED_FIELDS and value != base["fields"].get(key):
+                stored[key] = value
+
+    dates = {date for _, date, _ in events}
+    for date in dates:
+        if date in stored["meals"] or date in stored["workouts"] or date in stored["water_intake"]:
+            stored["daily_totals"][date] = compute_day_totals(stored, date)
+    meal_dates = sorted({date for kind, date, _ in events if kind == "meal"})
+    if meal_dates:
+        last = stored.get("streak_last_date")
+        if last is None or meal_dates[0] >= last:
+            for date in meal_dates:
+                record_meal_day(stored, date)
+        else:
+            backfill_streaks(stored)
+    grant_experience(stored, experience)
+    if latest is None or all(date >= latest for date in dates):
+        # Usual case, entries for the latest day or later: feed the rules as they come
+        for kind, date, payload in sorted(events, key=lambda event: event[1]):
+            achievements.on_event(stored, kind, date, payload)
+    else:
+        owned = set(stored["achievements"]) | set(session.get("achievements", []))
+        achievements.replay(stored)
+        stored["achievements"] += sorted(owned - set(stored["achievements"]))
+    return stored
+
+
+def _save_once(storage, user_data, changed, force, lock):
+    with lock:
+        prepared = storage.prepare(user_data, changed, force)
+    try:
+        revision = storage.commit(prepared)
+    except ConflictError:
+        return False
+    with lock:
+        user_data["revision"] = revision
+    return True
+
+
+def _merge_latest(storage, user_data, changed, lock):
+    stored = storage.load()
+    latest = max(stored.get("daily_totals", {}), default=None)
+    if changed is None or (latest is not None and any(date < latest for _, date in changed)):
+        # Merging into earlier days re-derives streaks and achievements over all of history
+        storage.load_history(stored)
+    ensure_daily_totals(stored)
+    ensure_streaks(stored)
+    with lock:
+        base = storage.sync_point(user_data.get("revision", 0))
+        replace_document(user_data, merge_concurrent(stored, user_data, base, changed))
+
+
+def replace_document(user_data, new):
+    # Gives the shared document `new`'s content in one step. Sessions read it without the
+    # lock: dict.update from a dict does not release the GIL, so they see the old sections
+    # or the new ones, never an emptied document, and the sections are fresh objects, so
+    # a render already iterating one carries on over the old version.
+    stale = [key for key in user_data if key not in new]
+    user_data.update(new)
+    for key in stale:
+        user_data.pop(key, None)
+
+
+def refresh_merging(storage, user_data, days=(), lock=None):
+    # Brings user_data up to what other writers saved since its revision, keeping entries
+    # it added on `days` (section, date pairs) and has not saved yet. False if it was current.
+    lock = lock or nullcontext()
+    if storage.stored_revision() == user_data.get("revision", 0):
+        return False
+    _merge_latest(storage, user_data, list(days), lock)
+    return True
+
+
+def save_merging(storage, user_data, changed=None, force=False, lock=None):
+    # Optimistic save: when another writer got there first, its document is reloaded,
+    # this writer's changes are merged into it, and user_data is updated in place so
+    # every session holding it sees the merged result. A forced save just retries at the
+    # new revision. `lock`, if given, guards user_data against concurrent edits; it is
+    # held while the document is serialized or merged, never during file I/O.
+    start = time.perf_counter()
+    try:
+        _save_merging(storage, user_data, changed, force, lock or nullcontext())
+    except Exception:
+        metrics.SAVE_FAILURES.inc()
+        raise
+    metrics.SAVES.labels("full" if changed is None else "days").inc()
+    metrics.SAVE_SECONDS.observe(time.perf_counter() - start)
+
+
+def _save_merging(storage, user_data, changed, force, lock):
+    for attempt in range(SAVE_ATTEMPTS):
+        if _save_once(storage, user_data, changed, force, lock):
+            return
+        metrics.SAVE_CONFLICTS.inc()
+        time.sleep(random.uniform(0, SAVE_BACKOFF_SECONDS * 2 ** attempt))
+        if not force:
+            _merge_latest(storage, user_data, changed, lock)
+    # Still losing to busier writers: hold the write lock over one last reload and save
+    with storage.exclusive():
+        if _save_once(storage, user_data, changed, force, lock):
+            return
+        if not force:
+            _merge_latest(storage, user_data, changed, lock)
+        if not _save_once(storage, user_data, changed, force, lock):
+            raise ConflictError(storage.stored_revision())
+
+
+# Per-type children of calorie_log_events_total, bound once for the log path
+_LOGGED = {kind: metrics.LOG_EVENTS.labels(kind) for kind in ("meal", "workout", "water", "weight")}
+
+
+class Tracker:
+    # The logging operations of the app over a plain user document, usable without
+    # Streamlit. `clock` returns the current datetime and decides which day entries land
+    # on; `intern` shares name strings between entries (storage.names). Callers that share
+    # the document across threads hold its lock around each call. Log methods return the
+    # (section, date) pairs to save and the achievements the event earned.
+
+    def __init__(self, user_data, clock=datetime.now, intern=None):
+        self.user_data = user_data
+        self.clock = clock
+        self.intern = intern
+
+    def today(self):
+        return self.clock().date().isoformat()
+
+    def _name(self, name):
+        return self.intern(name) if self.intern is not None else name
+
+    def _log(self, section, date, entry):
+        kind = ENTRY_KINDS[section]
+        self.user_data[section].setdefault(date, []).append(entry)
+        if kind == "meal":
+            add_meal_totals(self.user_data, date, entry)
+            record_meal_day(self.user_data, date)
+        elif kind == "workout":
+            add_workout_totals(self.user_data, date, entry)
+        else:
+            add_water_totals(self.user_data, date, entry)
+        earned = achievements.on_event(self.user_data, kind, date, entry)
+        _LOGGED[kind].inc()
+        self.user_data[COUNTERS[kind]] += 1
+        grant_experience(self.user_data, EXPERIENCE[kind])
+        return [(section, date), ("daily_totals", date)], earned
+
+    def log_meal(self, name, calories, protein, carbs, fat):
+        now = self.clock()
+        meal = Meal(self._name(name), calories, protein, carbs, fat, now.strftime("%H:%M"))
+        return self._log("meals", now.date().isoformat(), meal)
+
+    def log_workout(self, name, calories_burned):
+        now = self.clock()
+        workout = Workout(self._name(name), calories_burned, now.strftime("%H:%M"))
+        return self._log("workouts", now.date().isoformat(), workout)
+
+    def log_water(self, amount_ml):
+        now = self.clock()
+        return self._log("water_intake", now.date().isoformat(), Water(amount_ml, now.strftime("%H:%M")))
+
+    def log_weight(self, weight, target_weight=None):
+        today = self.today()
+        self.user_data["current_weight"] = weight
+        if target_weight is not None:
+            self.user_data["target_weight"] = target_weight
+        self.user_data["weight_log"][today] = weight
+        _LOGGED["weight"].inc()
+        return [("weight_log", today)], achievements.on_event(self.user_data, "weight", today, {"weight": weight})
+
+    def claim_daily_bonus(self):
+        # False if today's bonus was already claimed
+        today = self.today()
+        if self.user_data.get("last_bonus_date") == today:
+            return False
+        grant_experience(self.user_data, EXPERIENCE["daily_bonus"])
+        self.user_data["daily_bonus_claimed"] = True
+        self.user_data["last_bonus_date"] = today
+        return True
+
+    def start_day(self):
+        # Run once per visit: breaks a lapsed streak and settles day-based achievements.
+        # Returns whether achievements were replayed from history, and those earned.
+        today = self.today()
+        roll_streak(self.user_data, today)
+        replayed = achievements.ensure_achievements(self.user_data, today)
+        return replayed, achievements.on_rollover(self.user_data, today)
+
+    def day_totals(self, date=None):
+        return get_day_totals(self.user_data, date or self.today())
+
+    def entries(self, section, date=None):
+        return self.user_data[section].get(date or self.today(), [])
+
+    def streak(self):
+        return get_streak(self.user_data, self.today())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calorie tracker maintenance commands")
+    parser.add_argument("--backend", choices=sorted(STORAGE_BACKENDS), help="storage backend (default: CALORIE_STORAGE or segments)")
+    parser.add_argument("--user", help="user id (default: CALORIE_USER or default)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("rebuild-totals", help="recompute per-day aggregates from raw entries")
+    rebuild.add_argument("--check", action="store_true", help="only report mismatches, do not save")
+    commands.add_parser("rebuild-streaks", help="recompute current and best streaks from meal history")
+    commands.add_parser("replay-achievements", help="re-evaluate achievement rules over the whole history")
+    args = parser.parse_args()
+
+    storage = open_storage(args.backend, user=args.user)
+    user_data = storage.load()
+    if user_data is None:
+        print("No tracker data found.")
+        return
+    storage.load_history(user_data)
+
+    if args.command == "rebuild-totals":
+        mismatched = rebuild_daily_totals(user_data)
+        for date in mismatched:
+            print(f"mismatch: {date}")
+        print(f"{len(user_data['daily_totals'])} days checked, {len(mismatched)} mismatched")
+        if mismatched and not args.check:
+            save_merging(storage, user_data)
+            print("Rebuilt totals saved.")
+    elif args.command == "rebuild-streaks":
+        backfill_streaks(user_data)
+        save_merging(storage, user_data)
+        print(f"current streak {user_data['current_streak']} (since {user_data['streak_start']}), best {user_data['best_streak']}")
+    elif args.command == "replay-achievements":
+        earned = achievements.replay(user_data, date_type.today().isoformat())
+        save_merging(storage, user_data)
+        print(f"{len(earned)} achievements earned: {', '.join(earned) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()